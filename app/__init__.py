@@ -5,12 +5,40 @@ from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import config
+from .ping import PingBuffer
+from .cache import UserCache, ProfileCache, CountCache
+from .digest import NewUserDigest
+from .hashing import PasswordHasher
+from .compress import Compress
+from .assets import AssetManifest
+from .existence import ExistenceIndex
+from .pragmas import SQLitePragmas
+from .replica import RoutingSession, ReadReplica
+from .querystats import QueryStats
+from .slowlog import SlowQueryLog
+from .profiler import RequestProfiler
+from .metrics import Metrics
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+read_replica = ReadReplica()
+sqlite_pragmas = SQLitePragmas()
 loginManager = LoginManager()
+ping_buffer = PingBuffer()
+user_cache = UserCache()
+profile_cache = ProfileCache()
+count_cache = CountCache()
+new_user_digest = NewUserDigest()
+password_hasher = PasswordHasher()
+compress = Compress()
+assets = AssetManifest()
+existence_index = ExistenceIndex()
+query_stats = QueryStats()
+slow_query_log = SlowQueryLog()
+request_profiler = RequestProfiler()
+metrics = Metrics()
 loginManager.login_view = 'auth.login' # Endpoint of the login page, will redirect users to the login page when they try to access a protected page
 
 def create_app(config_name):
@@ -22,7 +50,25 @@ def create_app(config_name):
     mail.init_app(app)
     moment.init_app(app)
     db.init_app(app)
+    sqlite_pragmas.init_app(app)
+    read_replica.init_app(app)
     loginManager.init_app(app)
+    ping_buffer.init_app(app)
+    user_cache.init_app(app)
+    profile_cache.init_app(app)
+    count_cache.init_app(app)
+    new_user_digest.init_app(app)
+    password_hasher.init_app(app)
+    compress.init_app(app) # Registered first so it sees the final response body
+    assets.init_app(app)
+    existence_index.init_app(app)
+    query_stats.init_app(app) # After compress, so its debug panel gets compressed
+    slow_query_log.init_app(app)
+    request_profiler.init_app(app)
+    metrics.init_app(app)
+
+    from .email import mail_pool
+    mail_pool.init_app(app)
 
     #attach routes and custom error pages here
     from .main import main as main_blueprint
@@ -31,4 +77,7 @@ def create_app(config_name):
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
 
+    from .admin import admin as admin_blueprint
+    app.register_blueprint(admin_blueprint, url_prefix='/admin')
+
     return app
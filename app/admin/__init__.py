@@ -0,0 +1,7 @@
+""" Initializer for Administration Blueprint """
+
+from flask import Blueprint
+
+admin = Blueprint('admin', __name__)
+
+from . import views
@@ -0,0 +1,32 @@
+from flask_wtf import FlaskForm
+from wtforms import StringField, SelectField, SubmitField, DateField
+from wtforms.validators import DataRequired, Length, Regexp, Optional
+from ..directory import SORTS
+from ..models import role_table
+from ..profiler import MODES
+
+class ProfileRequestForm(FlaskForm):
+    # A second slash, or a backslash browsers read as one, would make the redirect leave the site
+    path = StringField('Path', validators=[DataRequired(), Length(1, 256),
+                                           Regexp(r'^/(?![/\\])', message='Paths start with one slash.')])
+    mode = SelectField('Profiler', choices=[(mode, mode) for mode in MODES])
+    submit = SubmitField('Profile Next Request')
+
+class UserDirectoryForm(FlaskForm):
+    """ Filters of the user directory, submitted as a GET query string """
+    role = SelectField('Role', coerce=int, default=0)
+    confirmed = SelectField('Confirmed', choices=[('', 'Any'), ('yes', 'Confirmed'), ('no', 'Unconfirmed')], default='')
+    member_since_from = DateField('Member since, from', validators=[Optional()])
+    member_since_to = DateField('Member since, to', validators=[Optional()])
+    last_seen_from = DateField('Last seen, from', validators=[Optional()])
+    last_seen_to = DateField('Last seen, to', validators=[Optional()])
+    sort = SelectField('Newest by', choices=[(sort, sort.replace('_', ' ').capitalize()) for sort in SORTS],
+                       default='member_since')
+    submit = SubmitField('Filter')
+
+    class Meta:
+        csrf = False # Read-only, and the filtered URL has to be shareable
+
+    def __init__(self, *args, **kwargs):
+        super(UserDirectoryForm, self).__init__(*args, **kwargs)
+        self.role.choices = [(0, 'Any')] + role_table().choices()
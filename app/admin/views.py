@@ -0,0 +1,83 @@
+""" Administration Blueprint Routes and View Functions """
+
+from datetime import datetime
+from urllib.parse import urlsplit
+from flask import render_template, redirect, abort, send_from_directory, request, stream_with_context, \
+    current_app
+from flask_login import login_required
+from . import admin
+from .forms import ProfileRequestForm, UserDirectoryForm
+from .. import request_profiler, directory
+from ..export import FORMATS, parse_columns, export_users
+from ..decorators import admin_required, read_only
+from ..models import role_table
+
+@admin.route('/profiles', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def profiles():
+    """ Lists the recent request profiles and arms the profiler for the administrator's next
+    request to a path, which it redirects to """
+    form = ProfileRequestForm()
+    if form.validate_on_submit():
+        target = urlsplit(form.path.data)
+        if target.scheme or target.netloc:
+            abort(400) # Only paths on this site
+        request_profiler.arm(form.path.data, form.mode.data)
+        return redirect(form.path.data)
+    return render_template('admin/profiles.html', form=form, profiles=request_profiler.profiles())
+
+@admin.route('/profiles/<filename>')
+@login_required
+@admin_required
+def profile_file(filename):
+    if not filename.endswith(('.pstats', '.txt', '.collapsed')):
+        abort(404)
+    return send_from_directory(request_profiler.profile_dir(), filename, as_attachment=filename.endswith('.pstats'))
+
+@admin.route('/users/export')
+@login_required
+@admin_required
+def export():
+    """ Streams every user as NDJSON or CSV, ``?format=ndjson|csv&columns=id,email,...`` """
+    file_format = request.args.get('format', 'ndjson')
+    if file_format not in FORMATS:
+        abort(400)
+    try:
+        columns = parse_columns(request.args.get('columns', ''))
+    except ValueError as e:
+        abort(400, str(e))
+
+    response = current_app.response_class(stream_with_context(export_users(columns, file_format)),
+                                          mimetype=FORMATS[file_format])
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename=users-{datetime.utcnow():%Y%m%d%H%M%S}.{file_format}'
+    response.cache_control.no_store = True
+    return response
+
+@admin.route('/users')
+@login_required
+@admin_required
+@read_only
+def users():
+    """ Lists users newest first, filtered by role, confirmation and date ranges, one
+    seek-paginated page at a time (see ``directory.page()``) """
+    form = UserDirectoryForm(formdata=request.args)
+    filters = directory.Filters()
+    if form.validate():
+        filters = directory.Filters(
+            role_id=form.role.data or None,
+            confirmed={'yes': True, 'no': False}.get(form.confirmed.data),
+            member_since_from=form.member_since_from.data, member_since_to=form.member_since_to.data,
+            last_seen_from=form.last_seen_from.data, last_seen_to=form.last_seen_to.data)
+
+    try:
+        page = directory.page(filters, form.sort.data if form.sort.data in directory.SORTS else 'member_since',
+                              request.args.get('after'), request.args.get('before'),
+                              current_app.config['FLASKY_USERS_PER_PAGE'])
+    except ValueError:
+        abort(400)
+
+    args = {key: value for key, value in request.args.items() if key not in ('after', 'before')}
+    return render_template('admin/users.html', form=form, page=page, args=args, roles=role_table(),
+                           count=directory.count(filters))
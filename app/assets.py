@@ -0,0 +1,148 @@
+""" Content-hashed ("fingerprinted") URLs for the files under ``app/static`` """
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+class AssetManifest:
+    """ Maps every static file to a name containing a hash of its content, e.g. ``styles.css`` to
+    ``styles.1a2b3c4d.css``, and makes ``url_for('static', ...)`` emit the fingerprinted names.
+
+    Because a fingerprinted URL changes whenever the file does, those URLs are served with a
+    one-year immutable Cache-Control and browsers stop revalidating them. The manifest is read
+    from ``FLASKY_ASSET_MANIFEST`` when ``flask assets`` has written one, otherwise it is built
+    when the app starts. It is also rebuilt at start in debug mode, and when a static file was
+    added, removed or modified after the manifest was written, since serving new content under
+    an old fingerprint would pin it in browsers for a year. With ``FLASKY_ASSET_GZIP`` the
+    ``.gz`` files written by ``flask assets --gzip`` are served to clients that accept gzip,
+    as long as they are newer than their source.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_ASSET_FINGERPRINTS', True)
+        app.config.setdefault('FLASKY_ASSET_MANIFEST', None)
+        app.config.setdefault('FLASKY_ASSET_GZIP', False)
+
+        if not app.config['FLASKY_ASSET_FINGERPRINTS'] or not app.has_static_folder:
+            return
+
+        path = self.manifest_path(app)
+        manifest = None
+        if os.path.exists(path) and not app.debug:
+            with open(path) as f:
+                manifest = json.load(f)
+            if self.stale(app.static_folder, path, manifest):
+                app.logger.warning('%s is older than the static files, rebuilding it. Run "flask assets" '
+                                   'after editing static files.', path)
+                manifest = None
+        if manifest is None:
+            manifest = self.scan(app.static_folder, path)
+
+        app.extensions['asset_manifest'] = {
+            'files': manifest,
+            'originals': {fingerprinted: name for name, fingerprinted in manifest.items()},
+        }
+        app.url_defaults(self.fingerprint_url)
+        app.view_functions['static'] = self.send_static
+
+    @staticmethod
+    def manifest_path(app) -> str:
+        return app.config['FLASKY_ASSET_MANIFEST'] or os.path.join(app.static_folder, 'manifest.json')
+
+    @staticmethod
+    def files(static_folder: str, manifest_path: str = None):
+        """ Yields ``(name, path)`` of every file under ``static_folder`` but the manifest and ``.gz`` copies """
+        for root, _, files in os.walk(static_folder):
+            for file in files:
+                path = os.path.join(root, file)
+                if file.endswith('.gz') or (manifest_path and
+                                            os.path.abspath(path) == os.path.abspath(manifest_path)):
+                    continue
+                yield os.path.relpath(path, static_folder).replace(os.sep, '/'), path
+
+    @classmethod
+    def scan(cls, static_folder: str, manifest_path: str = None) -> dict:
+        """ Hashes every file under ``static_folder``, skipping the manifest and ``.gz`` copies
+
+        Returns:
+            dict: fingerprinted name of every file, by path relative to ``static_folder``
+        """
+        manifest = {}
+        for name, path in cls.files(static_folder, manifest_path):
+            with open(path, 'rb') as f:
+                digest = hashlib.md5(f.read()).hexdigest()[:8]
+            stem, ext = os.path.splitext(name)
+            manifest[name] = f'{stem}.{digest}{ext}'
+        return manifest
+
+    @classmethod
+    def stale(cls, static_folder: str, manifest_path: str, manifest: dict) -> bool:
+        """ Whether files were added, removed or modified since ``manifest`` was written, judged
+        by modification times so starting the app doesn't hash every file """
+        written = os.path.getmtime(manifest_path)
+        names = set()
+        for name, path in cls.files(static_folder, manifest_path):
+            if os.path.getmtime(path) > written:
+                return True
+            names.add(name)
+        return names != set(manifest)
+
+    def build(self, app, precompress: bool = False) -> dict:
+        """ Writes the manifest used by later starts and, optionally, a ``.gz`` copy of every text asset """
+        manifest = self.scan(app.static_folder, self.manifest_path(app))
+
+        if precompress:
+            for name in manifest:
+                mimetype = mimetypes.guess_type(name)[0] or ''
+                if mimetype.startswith('text/') or mimetype in ('application/javascript', 'image/svg+xml'):
+                    path = os.path.join(app.static_folder, name)
+                    with open(path, 'rb') as src, open(path + '.gz', 'wb') as dst:
+                        dst.write(gzip.compress(src.read(), 9, mtime=0))
+
+        with open(self.manifest_path(app), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        return manifest
+
+    @staticmethod
+    def fingerprint_url(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            files = current_app.extensions['asset_manifest']['files']
+            values['filename'] = files.get(values['filename'], values['filename'])
+
+    @staticmethod
+    def send_static(filename):
+        """ Replacement for the static view that serves fingerprinted names as immutable """
+        original = current_app.extensions['asset_manifest']['originals'].get(filename)
+        if original is None:
+            return current_app.send_static_file(filename)
+
+        static_folder = current_app.static_folder
+        encoded = original + '.gz'
+        if current_app.config['FLASKY_ASSET_GZIP'] and request.accept_encodings['gzip'] \
+                and _newer(os.path.join(static_folder, encoded), os.path.join(static_folder, original)):
+            response = send_from_directory(static_folder, encoded, max_age=ONE_YEAR,
+                                           mimetype=mimetypes.guess_type(original)[0])
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = send_from_directory(static_folder, original, max_age=ONE_YEAR)
+
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+def _newer(path: str, than: str) -> bool:
+    """ Whether ``path`` exists and was modified no earlier than ``than`` """
+    try:
+        return os.path.getmtime(path) >= os.path.getmtime(than)
+    except OSError:
+        return False
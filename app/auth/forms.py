@@ -2,7 +2,7 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, Length, Email, Regexp, EqualTo
 from wtforms import ValidationError
-from ..models import User
+from .. import existence_index
 
 class LoginForm(FlaskForm):
     """ Model of view for logging users in. """
@@ -32,7 +32,7 @@ class RegistrationForm(FlaskForm):
         Args:
             field (_type_): Input field being validated against
         """
-        if User.query.filter_by(email=field.data).first():
+        if existence_index.email_taken(field.data):
             raise ValidationError('Email already registered.')
 
     def validate_username(self, field):
@@ -42,7 +42,7 @@ class RegistrationForm(FlaskForm):
         Args:
             field (_type_): Input field being validated against
         """
-        if User.query.filter_by(username=field.data).first():
+        if existence_index.username_taken(field.data):
             raise ValidationError('Username already in use.')
 
 class ChangePasswordForm(FlaskForm):
@@ -68,5 +68,5 @@ class ChangeEmailForm(FlaskForm):
     submit = SubmitField('Update Email Address')
 
     def validate_email(self, field):
-        if User.query.filter_by(email=field.data.lower()).first():
+        if existence_index.email_taken(field.data):
             raise ValidationError('Email already registered.')
@@ -1,11 +1,12 @@
 """ Authentication Blueprint Routes and View Functions """
 
-from flask import render_template, redirect, request, url_for, flash
+from flask import render_template, redirect, request, url_for, flash, jsonify
+from sqlalchemy.exc import IntegrityError
 from flask_login import login_user, logout_user, login_required, current_user
 from . import auth
-from ..models import User
+from ..models import User, normalize_email
 from .forms import LoginForm, RegistrationForm, ChangePasswordForm, ChangeEmailForm, PasswordResetRequestForm
-from app import db
+from app import db, user_cache, existence_index
 from ..email import send_email
 
 @auth.route('/login', methods=['GET', 'POST'])
@@ -13,9 +14,15 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
 
-        user = User.query.filter_by(email=form.email.data).first()
+        user = User.find_by_email(form.email.data)
 
         if user is not None and user.verify_password(form.password.data):
+            if user.password_needs_rehash():
+                # Upgrade hashes made with older parameters while the plain password is at hand
+                user.password = form.password.data
+                db.session.commit()
+                user_cache.invalidate(user.id)
+
             login_user(user, form.remember_me.data)
             next = request.args.get('next')
 
@@ -45,11 +52,20 @@ def register():
                     username=form.username.data,
                     password=form.password.data)
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.flush() # Assigns the user id needed by the token without ending the transaction
+        except IntegrityError:
+            # Taken by a rename on another worker that this worker's existence index hasn't seen yet
+            db.session.rollback()
+            existence_index.invalidate()
+            if form.validate():
+                flash('That username or email has just been taken.')
+            return render_template('auth/register.html', form=form)
 
         token = user.generate_confirmation_token()
         send_email(user.email, 'Confirm Your Account', 'auth/email/confirm', user=user,
                    token=token)
+        db.session.commit()
 
         flash('A confirmation email has been sent to you via email.')
 
@@ -58,6 +74,22 @@ def register():
     # Return user to registration page if validation of their input fails
     return render_template('auth/register.html', form=form)
 
+@auth.route('/check-availability')
+def check_availability():
+    """ JSON endpoint for live form validation, e.g. ``/auth/check-availability?username=john``.
+    Reports whether each given ``username`` and ``email`` is still free to register. """
+    result = {}
+    username = request.args.get('username')
+    email = request.args.get('email')
+
+    if username:
+        result['username'] = {'value': username,
+                              'available': not existence_index.username_taken(username)}
+    if email:
+        result['email'] = {'value': email,
+                           'available': not existence_index.email_taken(email)}
+    return jsonify(result)
+
 @auth.route('/confirm/<token>')
 @login_required
 def confirm(token: int):
@@ -76,6 +108,7 @@ def confirm(token: int):
 
     if current_user.confirm(token):
         db.session.commit()
+        user_cache.invalidate(current_user.id)
         flash('You have confirmed your account. Thanks!')
     else:
         flash('The confirmation link is invalid or has expired.')
@@ -114,6 +147,7 @@ def resend_confirmation():
     token = current_user.generate_confirmation_token()
     send_email(current_user.email, 'Confirm Your Account', 'auth/email/confirm',
         user=current_user, token=token)
+    db.session.commit()
     flash('A new confirmation email has been sent to you via email.')
     return redirect(url_for('main.index'))
 
@@ -126,6 +160,7 @@ def change_password():
             current_user.password = form.password.data
             db.session.add(current_user)
             db.session.commit()
+            user_cache.invalidate(current_user.id)
             flash('Your password has been updated.')
             return redirect(url_for('main.index'))
         else:
@@ -139,11 +174,12 @@ def password_reset_request():
     
     form = PasswordResetRequestForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data.lower()).first()
+        user = User.find_by_email(form.email.data)
         if user:
             token = user.generate_reset_token()
             send_email(user.email, 'Reset Your Password',
                 'auth/email/reset_password', user=user, token=token)
+            db.session.commit()
         flash('An email with instructions to reset your password has been sent to you.')
         return redirect(url_for('auth.login'))
     return render_template('auth/reset_password.html', form=form)
@@ -154,10 +190,11 @@ def change_email_request():
     form = ChangeEmailForm()
     if form.validate_on_submit():
         if current_user.verify_password(form.password.data):
-            new_email = form.emai.data.lower()
+            new_email = normalize_email(form.email.data)
             token = current_user.generate_email_change_token(new_email)
             send_email(new_email, 'Confirm your email address',
                        'auth/email/change_email', user=current_user, token=token)
+            db.session.commit()
             flash('An email with instructions to confirm your new email address has been sent to you')
             return redirect(url_for('main.index'))
         else:
@@ -169,6 +206,7 @@ def change_email_request():
 def change_email(token):
     if current_user.change_email(token):
         db.session.commit()
+        user_cache.invalidate(current_user.id)
         flash('Your email address has been updated.')
     else:
         flash('Invalid request.')
@@ -0,0 +1,174 @@
+""" In-process load benchmark of the main endpoints, driven through the WSGI app by concurrent clients """
+
+import itertools
+import json
+import platform
+import resource
+import threading
+import time
+from datetime import datetime, timezone
+from . import db, query_stats
+from .seed import seed_users
+
+PASSWORD = 'benchmark'
+
+def seed(count: int):
+    """ Recreates the tables with ``count`` confirmed users named ``user<i>``, all with password ``PASSWORD`` """
+    db.drop_all()
+    db.create_all()
+    seed_users(count, password=PASSWORD, confirmed=1.0, seed=0)
+
+class Client:
+    """ One simulated browser, with its own cookies """
+
+    def __init__(self, app, users: int, number: int):
+        self.http = app.test_client()
+        self.users = users
+        self.number = number
+        self.user = number % users
+
+    def login(self):
+        return self.http.post('/auth/login', data={'email': f'user{self.user}@example.com',
+                                                   'password': PASSWORD})
+
+_registrations = itertools.count()
+
+def _index(client, i):
+    return client.http.get('/')
+
+def _user(client, i):
+    return client.http.get(f'/user/user{(client.number * 7919 + i) % client.users}')
+
+def _login(client, i):
+    response = client.login()
+    client.http.get('/auth/logout')
+    return response
+
+def _register(client, i):
+    n = next(_registrations)
+    return client.http.post('/auth/register', data={
+        'email': f'new{n}@example.net', 'username': f'new{n}', 'password': PASSWORD, 'password2': PASSWORD})
+
+def _edit_profile(client, i):
+    return client.http.post('/edit-profile', data={'name': f'User {i}', 'location': 'Benchmark',
+                                                   'about_me': f'Edit number {i}'})
+
+SCENARIOS = {
+    # endpoint: (request, expected status)
+    'main.index': (_index, 200),
+    'main.user': (_user, 200),
+    'auth.login': (_login, 302),
+    'auth.register': (_register, 302),
+    'main.edit_profile': (_edit_profile, 302),
+}
+
+def percentile(values: list, fraction: float) -> float:
+    """ Nearest-rank percentile of already sorted ``values`` """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(fraction * len(values) + 0.5) - 1))]
+
+def run_scenario(app, endpoint: str, users: int, clients: int, requests: int) -> dict:
+    """ Sends ``requests`` requests to ``endpoint`` from ``clients`` concurrent clients """
+    send, expected = SCENARIOS[endpoint]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = itertools.count()
+    ready, go = threading.Barrier(clients + 1), threading.Barrier(clients + 1)
+
+    def work(client):
+        if endpoint == 'main.edit_profile':
+            client.login() # Logging in is measured by auth.login, not here
+        ready.wait()
+        go.wait()
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            started = time.perf_counter()
+            response = send(client, i)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != expected:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=work, args=(Client(app, users, number),)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    with query_stats.capture() as log:
+        started = time.perf_counter()
+        go.wait()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'queries_per_request': round(log.count / max(len(latencies), 1), 2), # auth.login includes its logout
+    }
+
+def run(app, users: int, clients: int, requests: int, endpoints=None, log=print) -> dict:
+    """ Seeds ``users`` users and benchmarks every endpoint of ``SCENARIOS``, or of ``endpoints`` """
+    with app.app_context():
+        started = time.perf_counter()
+        seed(users)
+        log(f'Seeded {users} users in {time.perf_counter() - started:.1f}s')
+
+        results = {}
+        for endpoint in endpoints or SCENARIOS:
+            results[endpoint] = run_scenario(app, endpoint, users, clients, requests)
+            r = results[endpoint]
+            log(f"{endpoint:20} {r['requests_per_second']:9.1f} req/s  p50 {r['p50_ms']:8.2f} ms  "
+                f"p95 {r['p95_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  {r['queries_per_request']:5.1f} queries  "
+                f"{r['errors']} errors")
+
+    # The high-water mark of the whole process, seeding included, not of any one endpoint
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    log(f'Peak RSS {peak_rss_kb // 1024} MiB')
+
+    return {
+        'meta': {'created': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(),
+                 'users': users, 'clients': clients, 'requests': requests, 'peak_rss_kb': peak_rss_kb},
+        'endpoints': results,
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """ Regressions of ``results`` against ``baseline``: latency or throughput worse by more than
+    ``tolerance`` (a fraction), more queries per request, or new errors
+
+    Returns:
+        list: one message per regression
+    """
+    regressions = []
+    for endpoint, current in results['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if previous is None:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f'{endpoint}: {key} {previous[key]} -> {current[key]}')
+        if current['requests_per_second'] < previous['requests_per_second'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: requests/s {previous['requests_per_second']} -> "
+                               f"{current['requests_per_second']}")
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(f"{endpoint}: queries/request {previous['queries_per_request']} -> "
+                               f"{current['queries_per_request']}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{endpoint}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+def save(results: dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
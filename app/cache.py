@@ -0,0 +1,206 @@
+""" Small in-process caches shared by the application's per-worker lookups """
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+class LRUCache:
+    """ Thread-safe least-recently-used cache with an optional time-to-live.
+
+    Entries can be given a cost (e.g. their size in bytes) and the cache then also evicts
+    until the total cost fits in ``maxcost``. Hits, misses and evictions are counted so the
+    cache can be sized from ``stats()``.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None, maxcost: int = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxcost = maxcost
+        self.cost = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, cost: int = 0):
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, time.monotonic(), cost)
+            self.cost += cost
+
+            while (self.maxsize is not None and len(self._data) > self.maxsize) or \
+                    (self.maxcost is not None and self.cost > self.maxcost and len(self._data) > 1):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.cost = 0
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self._data), 'maxsize': self.maxsize,
+                'cost': self.cost, 'maxcost': self.maxcost}
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.cost -= entry[2]
+
+class UserCache(LRUCache):
+    """ Per-worker cache of detached ``User`` snapshots used by the Flask-Login ``user_loader``.
+
+    Snapshots are handed back to the request through ``Session.merge(load=False)`` and
+    permissions are resolved through the ``RoleTable``, so a cache hit costs no queries at all.
+    Views that change a user must call ``invalidate(user.id)`` after committing.
+    """
+
+    def __init__(self, app=None):
+        super(UserCache, self).__init__()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_USER_CACHE_SIZE', 1024)
+        app.config.setdefault('FLASKY_USER_CACHE_TTL', 60)
+        self.maxsize = app.config['FLASKY_USER_CACHE_SIZE']
+        self.ttl = app.config['FLASKY_USER_CACHE_TTL']
+        self.clear()
+        app.extensions['user_cache'] = self
+
+    def load(self, user_id: int):
+        """ Returns the user with ``user_id`` attached to ``db.session``, or None if there is no such user """
+        from sqlalchemy.orm import Session
+        from . import db
+        from .models import User
+
+        if self.maxsize <= 0:
+            return db.session.get(User, user_id)
+
+        snapshot = self.get(user_id)
+
+        if snapshot is None:
+            # Loaded in a throwaway session so the snapshot is detached and fully populated
+            with Session(db.engine, expire_on_commit=False) as session:
+                snapshot = session.get(User, user_id)
+
+            if snapshot is None:
+                return None
+
+            self.set(user_id, snapshot)
+
+        return db.session.merge(snapshot, load=False)
+
+ProfileFragment = namedtuple('ProfileFragment', ['html', 'etag', 'rendered_at'])
+
+class ProfileCache(LRUCache):
+    """ Per-worker cache of the rendered profile part of ``main.user``, keyed by username and viewer class.
+
+    The fragment only varies with who is looking at it, so the viewers are grouped into classes
+    (see ``viewer_class()``) instead of being cached one by one. Entries are bounded by
+    ``FLASKY_PROFILE_CACHE_BYTES`` and expire after ``FLASKY_PROFILE_CACHE_TTL`` seconds, which
+    also bounds how stale the "last seen" time can get.
+    """
+
+    VIEWER_CLASSES = ('anonymous', 'self', 'administrator', 'administrator-self')
+
+    def __init__(self, app=None):
+        super(ProfileCache, self).__init__()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_PROFILE_CACHE_BYTES', 4 * 1024 * 1024)
+        app.config.setdefault('FLASKY_PROFILE_CACHE_TTL', 60)
+        self.maxsize = None
+        self.maxcost = app.config['FLASKY_PROFILE_CACHE_BYTES']
+        self.ttl = app.config['FLASKY_PROFILE_CACHE_TTL']
+        self.clear()
+        app.extensions['profile_cache'] = self
+
+    @staticmethod
+    def viewer_class(current_user, username: str) -> str:
+        """ Groups viewers by what the profile shows them: everyone without extra rights
+        sees the same page as an anonymous visitor. """
+        if current_user.is_anonymous:
+            return 'anonymous'
+        own = current_user.username == username
+        if current_user.is_administrator():
+            return 'administrator-self' if own else 'administrator'
+        return 'self' if own else 'anonymous'
+
+    def store(self, username: str, viewer: str, html: str) -> ProfileFragment:
+        encoded = html.encode('utf-8')
+        fragment = ProfileFragment(html, hashlib.md5(encoded).hexdigest(),
+                                   datetime.now(timezone.utc).replace(microsecond=0))
+        if self.maxcost > 0:
+            self.set((username, viewer), fragment, cost=len(encoded))
+        return fragment
+
+    def invalidate_user(self, *usernames):
+        """ Drops every viewer class of the given users' profiles """
+        for username in usernames:
+            for viewer in self.VIEWER_CLASSES:
+                self.invalidate((username, viewer))
+
+class CountCache(LRUCache):
+    """ Per-worker cache of ``COUNT(*)`` results, keyed by the caller.
+
+    Counting every row a filter matches costs as much as reading them, so paginated pages
+    reuse the count for ``FLASKY_COUNT_CACHE_TTL`` seconds; totals shown next to a list may
+    lag that long behind inserts.
+    """
+
+    def __init__(self, app=None):
+        super(CountCache, self).__init__()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_COUNT_CACHE_SIZE', 256)
+        app.config.setdefault('FLASKY_COUNT_CACHE_TTL', 60)
+        self.maxsize = app.config['FLASKY_COUNT_CACHE_SIZE']
+        self.ttl = app.config['FLASKY_COUNT_CACHE_TTL']
+        self.clear()
+        app.extensions['count_cache'] = self
+
+    def count(self, key, statement) -> int:
+        """ The cached count for ``key``, running ``statement`` on a miss """
+        from . import db
+
+        count = self.get(key)
+        if count is None:
+            count = db.session.scalar(statement) or 0
+            if self.maxsize:
+                self.set(key, count)
+        return count
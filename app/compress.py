@@ -0,0 +1,121 @@
+""" Response compression and conditional GET handling for the application's own responses """
+
+import gzip
+import hashlib
+import zlib
+from flask import current_app, request
+from werkzeug.http import parse_etags, quote_etag
+from .cache import LRUCache
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/xml', 'text/csv',
+                          'application/json', 'application/javascript', 'application/xml'}
+
+class Compress:
+    """ ``after_request`` hook, enabled by ``FLASKY_COMPRESS``, that gives every GET response an ETag,
+    answers matching ``If-None-Match`` requests with 304, and gzip/deflate-compresses text bodies
+    of at least ``FLASKY_COMPRESS_MIN_SIZE`` bytes.
+
+    Compressed bodies are kept in a cache bounded by ``FLASKY_COMPRESS_CACHE_BYTES`` and keyed by
+    the MD5 of the body itself rather than by the view's ETag, which need not cover every byte
+    (hooks such as the query panel change the body after the view), so pages that render
+    identically are only compressed once and a body is never answered with another's.
+    Streamed responses and files served by ``send_file`` are left alone.
+
+    Clients revalidate compressed pages with the suffixed tag, ``"<etag>-gzip"``, so a ``before_request``
+    hook adds the unsuffixed tag to ``If-None-Match`` for views that check their own ETag, and the 304
+    they answer with is given back the suffixed tag.
+
+    Register it before any other ``after_request`` hook that changes the body, since Flask runs
+    these hooks in reverse order of registration.
+    """
+
+    def __init__(self, app=None):
+        self.cache = LRUCache(maxsize=None)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_COMPRESS', False)
+        app.config.setdefault('FLASKY_COMPRESS_LEVEL', 6)
+        app.config.setdefault('FLASKY_COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('FLASKY_COMPRESS_CACHE_BYTES', 8 * 1024 * 1024)
+        self.cache.maxcost = app.config['FLASKY_COMPRESS_CACHE_BYTES']
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        header = request.environ.get('HTTP_IF_NONE_MATCH')
+        if not header or not current_app.config['FLASKY_COMPRESS'] or request.method not in ('GET', 'HEAD'):
+            return
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return
+
+        suffix = f'-{encoding}'
+        tags = [tag[:-len(suffix)] for tag in parse_etags(header).as_set(include_weak=True)
+                if tag.endswith(suffix)]
+        if tags:
+            request.environ['HTTP_IF_NONE_MATCH'] = ', '.join([header] + [quote_etag(tag) for tag in tags])
+
+    def after_request(self, response):
+        config = current_app.config
+        if config['FLASKY_COMPRESS'] and response.status_code == 304:
+            return self.suffix_not_modified(response)
+        if not config['FLASKY_COMPRESS'] or request.method not in ('GET', 'HEAD') \
+                or response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+                or 'Content-Encoding' in response.headers or response.cache_control.no_transform:
+            return response
+
+        body = response.get_data()
+        digest = hashlib.md5(body).hexdigest()
+        etag, weak = response.get_etag()
+        if etag is None:
+            etag = digest
+
+        encoding = None
+        if response.mimetype in COMPRESSIBLE_MIMETYPES and \
+                len(body) >= config['FLASKY_COMPRESS_MIN_SIZE']:
+            response.vary.add('Accept-Encoding')
+            encoding = self.choose_encoding()
+
+        # Each encoding is a different representation and needs its own validator
+        response.set_etag(f'{etag}-{encoding}' if encoding else etag, weak=weak)
+        response.make_conditional(request)
+
+        if encoding is None or response.status_code == 304:
+            return response
+
+        key = (digest, encoding)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            compressed = self.compress(body, encoding, config['FLASKY_COMPRESS_LEVEL'])
+            self.cache.set(key, compressed, cost=len(compressed))
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def suffix_not_modified(self, response):
+        """ Gives a 304 answered by the view the tag of the compressed representation the client holds """
+        etag, weak = response.get_etag()
+        encoding = self.choose_encoding()
+        if etag is not None and encoding is not None and \
+                request.if_none_match.contains_weak(f'{etag}-{encoding}'):
+            response.set_etag(f'{etag}-{encoding}', weak=weak)
+            response.vary.add('Accept-Encoding')
+        return response
+
+    @staticmethod
+    def choose_encoding():
+        accepted = request.accept_encodings
+        for encoding in ('gzip', 'deflate'):
+            if accepted[encoding]:
+                return encoding
+        return None
+
+    @staticmethod
+    def compress(body: bytes, encoding: str, level: int) -> bytes:
+        if encoding == 'gzip':
+            return gzip.compress(body, level, mtime=0)
+        return zlib.compress(body, level)
@@ -1,6 +1,7 @@
 from functools import wraps
-from flask import abort
+from flask import abort, request
 from flask_login import current_user
+from . import db, read_replica
 from .models import Permission
 
 def permission_required(permission):
@@ -14,4 +15,19 @@ def permission_required(permission):
     return decorator
 
 def admin_required(f):
-    return permission_required(Permission.ADMIN)(f)
\ No newline at end of file
+    return permission_required(Permission.ADMIN)(f)
+
+def read_only(f):
+    """ Sends the queries of GET and HEAD requests to the read replica, unless the user
+    committed something too recently for the replica to have it """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not read_replica.fresh_enough():
+            return f(*args, **kwargs)
+
+        db.session.info['use_replica'] = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            db.session.info.pop('use_replica', None)
+    return decorated_function
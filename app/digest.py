@@ -0,0 +1,83 @@
+""" Digest of the "New User" notifications sent to ``FLASKY_ADMIN`` """
+
+import atexit
+import threading
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+
+NewUser = namedtuple('NewUser', ['username', 'joined'])
+
+class _DigestState:
+    def __init__(self, app):
+        self.app = app
+        self.window = app.config['FLASKY_ADMIN_DIGEST_WINDOW']
+        self.users = []
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def add(self, user: NewUser):
+        with self.lock:
+            self.users.append(user)
+            if self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self) -> int:
+        with self.lock:
+            users, self.users = self.users, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        if users:
+            with self.app.app_context():
+                _send(users)
+        return len(users)
+
+class NewUserDigest:
+    """ Collects the users created by ``main.index`` and emails ``FLASKY_ADMIN`` one digest per
+    ``FLASKY_ADMIN_DIGEST_WINDOW`` seconds, starting with the first user of the window.
+    A window of 0 sends one "New User" email per user as soon as it is created. """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_ADMIN_DIGEST_WINDOW', 0)
+        state = _DigestState(app)
+        app.extensions['new_user_digest'] = state
+        atexit.register(state.flush)
+
+    def add(self, user):
+        """ Notifies ``FLASKY_ADMIN`` that ``user`` joined, now or in the next digest """
+        state = current_app.extensions['new_user_digest']
+
+        if state.window <= 0:
+            from .email import send_email
+            send_email(current_app.config['FLASKY_ADMIN'], 'New User', 'mail/new_user', user=user)
+        else:
+            state.add(NewUser(user.username, user.member_since or datetime.utcnow()))
+
+    def flush(self) -> int:
+        """ Sends the pending digest right away
+
+        Returns:
+            int: number of users in the digest that was sent
+        """
+        return current_app.extensions['new_user_digest'].flush()
+
+def _send(users):
+    from . import db
+    from .email import send_email
+
+    subject = 'New User' if len(users) == 1 else f'{len(users)} New Users'
+    try:
+        send_email(current_app.config['FLASKY_ADMIN'], subject, 'mail/new_users', users=users)
+        db.session.commit()
+    except Exception:
+        current_app.logger.exception('Failed to send the new user digest for %d users', len(users))
+    finally:
+        db.session.remove()
@@ -1,18 +1,186 @@
-from threading import Thread
+import atexit
+import queue
+import smtplib
+import threading
+import time
 from flask import render_template, current_app
 from flask_mail import Message
-from . import mail
+from . import db, mail
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+class MailQueueFull(RuntimeError):
+    """ Raised by ``send_email`` when the mail queue stayed full for ``FLASKY_MAIL_ENQUEUE_TIMEOUT`` seconds """
+
+class _MailPoolState:
+    """ Queue, worker threads and counters of the mail pool of one application """
+
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config['FLASKY_MAIL_WORKERS']
+        self.batch_size = app.config['FLASKY_MAIL_BATCH_SIZE']
+        self.enqueue_timeout = app.config['FLASKY_MAIL_ENQUEUE_TIMEOUT']
+        self.idle_timeout = app.config['FLASKY_MAIL_IDLE_TIMEOUT']
+        self.queue = queue.Queue(maxsize=app.config['FLASKY_MAIL_QUEUE_SIZE'])
+        self.threads = []
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+        self.send_time = 0.0
+        self.max_send_time = 0.0
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.run, name=f'mail-worker-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        atexit.register(self.shutdown)
+
+    def shutdown(self, timeout: float = 10):
+        """ Lets the workers drain the queue, then stops them """
+        threads, self.threads = self.threads, []
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def run(self):
+        with self.app.app_context():
+            connection = None
+            try:
+                while True:
+                    try:
+                        msg = self.queue.get(timeout=self.idle_timeout)
+                    except queue.Empty:
+                        # Close idle SMTP sessions before the server drops them
+                        connection = self.disconnect(connection)
+                        continue
+
+                    batch = [msg]
+                    while msg is not None and len(batch) < self.batch_size:
+                        try:
+                            msg = self.queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        batch.append(msg)
+
+                    for msg in batch:
+                        if msg is None:
+                            self.queue.task_done()
+                            return
+                        connection = self.send(connection, msg)
+                        self.queue.task_done()
+            finally:
+                self.disconnect(connection)
+
+    def send(self, connection, msg):
+        """ Sends ``msg`` over ``connection``, reconnecting once if the session was lost """
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                if connection is None:
+                    connection = mail.connect().__enter__()
+                    with self.lock:
+                        self.connections += 1
+                connection.send(msg)
+                break
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                # The server rejected this message, the session itself is still usable
+                self.record_failure(msg, e)
+                return connection
+            except OSError as e:
+                connection = self.disconnect(connection)
+                if attempt:
+                    self.record_failure(msg, e)
+                    return connection
+            except Exception as e:
+                self.record_failure(msg, e)
+                return connection
+
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.sent += 1
+            self.send_time += elapsed
+            self.max_send_time = max(self.max_send_time, elapsed)
+        return connection
+
+    def disconnect(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
+
+    def record_failure(self, msg, error):
+        with self.lock:
+            self.failed += 1
+        current_app.logger.error('Failed to send "%s" to %s: %s', msg.subject, msg.recipients, error)
+
+class MailPool:
+    """ Fixed-size pool of threads sending queued emails.
+
+    Each worker keeps one ``mail.connect()`` session open while there is mail to send and sends
+    up to ``FLASKY_MAIL_BATCH_SIZE`` messages per wake-up. The queue holds at most
+    ``FLASKY_MAIL_QUEUE_SIZE`` messages; once it is full ``send_email`` blocks for up to
+    ``FLASKY_MAIL_ENQUEUE_TIMEOUT`` seconds and then raises ``MailQueueFull``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_MAIL_WORKERS', 2)
+        app.config.setdefault('FLASKY_MAIL_QUEUE_SIZE', 1000)
+        app.config.setdefault('FLASKY_MAIL_BATCH_SIZE', 20)
+        app.config.setdefault('FLASKY_MAIL_ENQUEUE_TIMEOUT', 5)
+        app.config.setdefault('FLASKY_MAIL_IDLE_TIMEOUT', 30)
+        app.extensions['mail_pool'] = _MailPoolState(app)
+
+    @property
+    def state(self) -> _MailPoolState:
+        return current_app.extensions['mail_pool']
+
+    def submit(self, msg: Message):
+        state = self.state
+        state.start()
+        try:
+            state.queue.put(msg, timeout=state.enqueue_timeout)
+        except queue.Full:
+            raise MailQueueFull(f'Mail queue is full ({state.queue.maxsize} messages)')
+
+    def join(self):
+        """ Blocks until every queued message has been handled """
+        self.state.queue.join()
+
+    def stats(self) -> dict:
+        state = self.state
+        with state.lock:
+            return {'queue_depth': state.queue.qsize(),
+                    'sent': state.sent,
+                    'failed': state.failed,
+                    'connections': state.connections,
+                    'avg_send_seconds': state.send_time / state.sent if state.sent else 0.0,
+                    'max_send_seconds': state.max_send_time}
+
+mail_pool = MailPool()
 
 def send_email(to, subject, template, **kwargs):
+    """ Renders and sends an email. With ``FLASKY_MAIL_OUTBOX`` enabled the email is added to the
+    current session as an ``OutboxEmail`` and is only delivered, by ``flask mail-worker``, once the
+    caller commits. Otherwise it is queued on the in-process ``mail_pool``. """
     app = current_app._get_current_object()
     msg = Message(app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + " " + subject,
                   sender=app.config['FLASKY_MAIL_SENDER'], recipients=[to])
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
+
+    if app.config['FLASKY_MAIL_OUTBOX']:
+        from .models import OutboxEmail
+        db.session.add(OutboxEmail.from_message(msg))
+    else:
+        mail_pool.submit(msg)
+    return msg
@@ -0,0 +1,174 @@
+""" In-memory Bloom filters answering "is this username / email taken?" without touching the database """
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+
+# Renames stamped this long before a sync are read again by the next one, to cover
+# transactions that committed late and clocks of other hosts running behind
+RENAME_OVERLAP = timedelta(seconds=60)
+
+class BloomFilter:
+    """ Fixed-size Bloom filter: ``in`` is never wrong when it says no, and wrong about a yes
+    with probability ``error_rate`` once ``capacity`` values have been added. """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.count = 0
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        # Double hashing: k positions from the two halves of one 128-bit digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & 1 << (position & 7)
+                   for position in self._positions(value))
+
+def normalize(value: str) -> str:
+    return (value or '').strip().lower()
+
+class _IndexState:
+    def __init__(self, app):
+        self.error_rate = app.config['FLASKY_EXISTENCE_ERROR_RATE']
+        self.sync_interval = app.config['FLASKY_EXISTENCE_SYNC_INTERVAL']
+        self.rebuild_interval = app.config['FLASKY_EXISTENCE_REBUILD_INTERVAL']
+        self.usernames = None
+        self.emails = None
+        self.max_id = 0
+        self.renamed_since = None
+        self.built_at = 0
+        self.synced_at = 0
+        self.lock = threading.RLock()
+
+    def add(self, username, email):
+        with self.lock:
+            if self.usernames is None:
+                return
+            if username:
+                self.usernames.add(normalize(username))
+            if email:
+                self.emails.add(normalize(email))
+            if self.usernames.count > self.usernames.capacity:
+                self.built_at = 0 # Over capacity the error rate climbs, rebuild on next use
+
+    def rebuild(self):
+        from . import db
+        from .models import User
+
+        started = datetime.utcnow()
+        count = db.session.scalar(db.select(db.func.count(User.id))) or 0
+        capacity = max(2 * count, 10000) # Room to grow before the next rebuild
+        usernames = BloomFilter(capacity, self.error_rate)
+        emails = BloomFilter(capacity, self.error_rate)
+        max_id = 0
+
+        rows = db.session.execute(db.select(User.id, User.username, User.email)
+                                  .execution_options(yield_per=10000))
+        for user_id, username, email in rows:
+            if username:
+                usernames.add(normalize(username))
+            if email:
+                emails.add(normalize(email))
+            max_id = max(max_id, user_id)
+
+        with self.lock:
+            self.usernames, self.emails, self.max_id = usernames, emails, max_id
+            self.renamed_since = started - RENAME_OVERLAP
+            self.built_at = self.synced_at = time.monotonic()
+
+    def sync(self):
+        """ Adds the users inserted or renamed since the last sync, e.g. by another worker """
+        from . import db
+        from .models import User
+
+        started = datetime.utcnow()
+        rows = db.session.execute(db.select(User.id, User.username, User.email)
+                                  .where(or_(User.id > self.max_id, User.renamed_at >= self.renamed_since))).all()
+        with self.lock:
+            for user_id, username, email in rows:
+                self.add(username, email)
+                self.max_id = max(self.max_id, user_id)
+            self.renamed_since = started - RENAME_OVERLAP
+            self.synced_at = time.monotonic()
+
+    def ensure_current(self):
+        now = time.monotonic()
+        if self.usernames is None or not self.built_at or now - self.built_at > self.rebuild_interval:
+            self.rebuild()
+        elif now - self.synced_at > self.sync_interval:
+            self.sync()
+
+class ExistenceIndex:
+    """ Bloom filters over the normalized usernames and emails of all users.
+
+    A negative answer lets most lookups of free names skip the database; a positive answer
+    is confirmed with a query. The filters are built on first use, updated whenever this
+    worker inserts or updates a user, catch up on other workers' inserts and renames (by
+    ``users.renamed_at``) at most every ``FLASKY_EXISTENCE_SYNC_INTERVAL`` seconds and are
+    rebuilt every ``FLASKY_EXISTENCE_REBUILD_INTERVAL`` seconds to resize them and drop old names.
+    Between syncs a name another worker just wrote is reported free: the unique constraints
+    on ``users`` remain the final guard, and views writing names catch their ``IntegrityError``
+    and ``invalidate()`` the index.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_EXISTENCE_FILTER', True)
+        app.config.setdefault('FLASKY_EXISTENCE_ERROR_RATE', 0.01)
+        app.config.setdefault('FLASKY_EXISTENCE_SYNC_INTERVAL', 5)
+        app.config.setdefault('FLASKY_EXISTENCE_REBUILD_INTERVAL', 3600)
+        app.extensions['existence_index'] = _IndexState(app)
+
+    @property
+    def state(self) -> _IndexState:
+        return current_app.extensions['existence_index']
+
+    def username_may_exist(self, username: str) -> bool:
+        """ False when no user can have ``username``, True when one might """
+        if not current_app.config['FLASKY_EXISTENCE_FILTER']:
+            return True
+        state = self.state
+        state.ensure_current()
+        return normalize(username) in state.usernames
+
+    def email_may_exist(self, email: str) -> bool:
+        """ False when no user can have ``email``, True when one might """
+        if not current_app.config['FLASKY_EXISTENCE_FILTER']:
+            return True
+        state = self.state
+        state.ensure_current()
+        return normalize(email) in state.emails
+
+    def username_taken(self, username: str) -> bool:
+        from .models import User
+        return self.username_may_exist(username) and \
+            User.query.filter_by(username=username).first() is not None
+
+    def email_taken(self, email: str) -> bool:
+        from .models import User
+        return self.email_may_exist(email) and User.find_by_email(email) is not None
+
+    def add(self, username: str, email: str):
+        """ Records a username and email written to the database """
+        self.state.add(username, email)
+
+    def invalidate(self):
+        """ Rebuilds the filters on next use, e.g. after a write hit a name they reported free """
+        self.state.built_at = 0
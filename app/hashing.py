@@ -0,0 +1,78 @@
+""" Password hashing service that runs the key derivation functions in a process pool """
+
+import atexit
+import multiprocessing
+import threading
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _executor(size: int) -> ProcessPoolExecutor:
+    """ Process pools are shared per size by every app of the process and created on first use.
+    Workers are started from a fork server, not forked from the web process: its mail, digest and
+    sampler threads may hold a lock at the moment of the fork, which would deadlock the child. """
+    with _executors_lock:
+        executor = _executors.get(size)
+        if executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            executor = _executors[size] = ProcessPoolExecutor(max_workers=size,
+                                                              mp_context=multiprocessing.get_context(method))
+            atexit.register(executor.shutdown)
+        return executor
+
+class _HasherState:
+    def __init__(self, app):
+        self.method = app.config['FLASKY_PASSWORD_HASH_METHOD']
+        self.pool_size = app.config['FLASKY_PASSWORD_HASH_POOL_SIZE']
+        # Werkzeug expands shorthand methods such as "pbkdf2", so compare against the prefix it writes
+        self.prefix = generate_password_hash('', self.method, salt_length=1).split('$', 1)[0]
+
+class PasswordHasher:
+    """ Hashes and verifies passwords with ``FLASKY_PASSWORD_HASH_METHOD``.
+
+    With ``FLASKY_PASSWORD_HASH_POOL_SIZE`` above 0 the work runs in a process pool, so a
+    request waiting on a hash doesn't hold the GIL the worker's other threads need.
+    A pool size of 0 hashes inline.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+        app.config.setdefault('FLASKY_PASSWORD_HASH_POOL_SIZE', 0)
+        app.extensions['password_hasher'] = _HasherState(app)
+
+    @property
+    def state(self) -> _HasherState:
+        return current_app.extensions['password_hasher']
+
+    def _run(self, fn, *args):
+        state = self.state
+        if state.pool_size <= 0:
+            return fn(*args)
+        return _executor(state.pool_size).submit(fn, *args).result()
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.state.method)
+
+    def hash_many(self, passwords: list, workers: int = None) -> list:
+        """ Hashes ``passwords`` across ``workers`` processes, by default the configured pool """
+        state = self.state
+        workers = state.pool_size if workers is None else workers
+        if workers <= 0:
+            return [generate_password_hash(password, state.method) for password in passwords]
+        return list(_executor(workers).map(generate_password_hash, passwords, repeat(state.method),
+                                           chunksize=max(1, len(passwords) // (4 * workers))))
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """ Whether ``password_hash`` was made with other parameters than the configured method """
+        return password_hash.split('$', 1)[0] != self.state.prefix
@@ -0,0 +1,76 @@
+""" Deterministic identicon PNGs rendered from avatar hashes, without any imaging dependency """
+
+import colorsys
+import os
+import struct
+import tempfile
+import zlib
+
+GRID = 5 # Cells per row and column, the left half is mirrored onto the right
+BACKGROUND = (240, 240, 240)
+
+def render(avatar_hash: str, size: int) -> bytes:
+    """ Renders the identicon for ``avatar_hash`` as a ``size`` x ``size`` PNG
+
+    Args:
+        avatar_hash (str): hex digest the pattern and color are derived from
+        size (int): width and height of the image in pixels, at least ``GRID``
+
+    Returns:
+        bytes: the PNG file
+    """
+    digest = bytes.fromhex(avatar_hash)
+    hue = int.from_bytes(digest[-2:], 'big') / 0xffff
+    color = tuple(round(c * 255) for c in colorsys.hls_to_rgb(hue, 0.5, 0.6))
+
+    # One bit per cell of the left three columns, the other two mirror them
+    half = (GRID + 1) // 2
+    cells = [[False] * GRID for _ in range(GRID)]
+    for i in range(GRID * half):
+        row, column = divmod(i, half)
+        cells[row][column] = cells[row][GRID - 1 - column] = bool(digest[i // 8] >> (i % 8) & 1)
+
+    padding = size // 12
+    cell = (size - 2 * padding) // GRID
+    offset = (size - cell * GRID) // 2
+    trailing = size - offset - cell * GRID
+    foreground, background = bytes(color), bytes(BACKGROUND)
+    blank = b'\x00' + background * size # Each scanline starts with PNG filter type "None"
+
+    rows = [blank * offset]
+    for cell_row in cells:
+        line = b'\x00' + background * offset + \
+            b''.join((foreground if on else background) * cell for on in cell_row) + \
+            background * trailing
+        rows.append(line * cell)
+    rows.append(blank * trailing)
+
+    return _png(size, size, b''.join(rows))
+
+def cached_path(cache_dir: str, avatar_hash: str, size: int) -> str:
+    """ Path of the cached PNG for (``avatar_hash``, ``size``), rendering it on first use.
+    The file is written under a unique temporary name and renamed, so concurrent workers and
+    threads never serve a partially written image. """
+    path = os.path.join(cache_dir, avatar_hash[:2], f'{avatar_hash}-{size}.png')
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(render(avatar_hash, size))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    return path
+
+def _png(width: int, height: int, raw: bytes) -> bytes:
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + \
+            struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0) # 8-bit RGB
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + \
+        chunk(b'IDAT', zlib.compress(raw, 9)) + chunk(b'IEND', b'')
@@ -0,0 +1,158 @@
+""" Streaming bulk import of user accounts from CSV or JSON Lines files """
+
+import csv
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from flask import current_app
+from werkzeug.datastructures import MultiDict
+from . import db, password_hasher, existence_index, user_cache
+from .auth.forms import RegistrationForm
+from .models import User, normalize_email, role_table
+
+OPTIONAL_FIELDS = ('name', 'location', 'about_me')
+
+def read_records(path: str, format: str = None):
+    """ Yields ``(number, record, error)`` for every record of ``path``, numbered from 1.
+
+    ``format`` is ``csv``, with a header row, or ``jsonl``; by default it follows the file
+    extension. Records that cannot be parsed come with ``record`` None and an ``error``.
+    """
+    format = format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='' if format == 'csv' else None, encoding='utf-8') as f:
+        if format == 'csv':
+            for number, record in enumerate(csv.DictReader(f), 1):
+                yield number, record, None
+            return
+
+        for number, line in enumerate((line for line in f if line.strip()), 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield number, None, 'Invalid JSON'
+                continue
+            if not isinstance(record, dict):
+                yield number, None, 'Not a JSON object'
+                continue
+            yield number, record, None
+
+def validate(records, pending: set):
+    """ Runs every record through ``RegistrationForm``, yielding ``(number, record, errors)``
+    with ``errors`` None for valid records. ``pending`` holds the normalized usernames and emails
+    of accepted records not yet in the database, so duplicates within a batch are caught too.
+    """
+    for number, record, error in records:
+        if error is not None:
+            yield number, record, {'record': [error]}
+            continue
+
+        record = {key: str(value) for key, value in record.items() if key and value is not None}
+        form = RegistrationForm(formdata=MultiDict({**record, 'password2': record.get('password', '')}),
+                                meta={'csrf': False})
+        if not form.validate():
+            yield number, record, {field: errors for field, errors in form.errors.items() if field != 'password2'}
+            continue
+
+        email, username = normalize_email(record['email']), record['username']
+        if email in pending:
+            yield number, record, {'email': ['Email already registered.']}
+        elif username.lower() in pending:
+            yield number, record, {'username': ['Username already in use.']}
+        else:
+            pending.update((email, username.lower()))
+            yield number, record, None
+
+def checkpoint_path(path: str) -> str:
+    return path + '.checkpoint'
+
+def rejects_path(path: str) -> str:
+    return path + '.rejects.jsonl'
+
+def read_checkpoint(path: str) -> dict:
+    try:
+        with open(checkpoint_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'record': 0, 'imported': 0, 'rejected': 0}
+
+def write_checkpoint(path: str, checkpoint: dict):
+    with open(checkpoint_path(path) + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(checkpoint_path(path) + '.tmp', checkpoint_path(path))
+
+def import_users(path: str, format: str = None, batch_size: int = 1000, workers: int = None,
+                 confirmed: bool = False, restart: bool = False, log=None) -> dict:
+    """ Imports the accounts of ``path`` in batches of ``batch_size`` records.
+
+    Records need ``email``, ``username`` and ``password`` and may have ``name``, ``location``
+    and ``about_me``; they are held to the rules of ``RegistrationForm``. Passwords of a batch
+    are hashed across ``workers`` processes (by default ``FLASKY_PASSWORD_HASH_POOL_SIZE``), then
+    the batch is inserted with one Core ``INSERT`` and committed, so memory stays constant
+    whatever the file size. Rejected records go to ``<path>.rejects.jsonl``, without their
+    password, with the reasons.
+
+    After every batch the number of the last record handled is saved in ``<path>.checkpoint``;
+    a later run resumes after it unless ``restart`` is set. Records of a batch committed just
+    before a crash, ahead of its checkpoint, are rejected as duplicates on resume.
+
+    Returns:
+        dict: ``imported``, ``rejected``, ``skipped``, ``seconds`` and ``rows_per_second``
+    """
+    started = time.perf_counter()
+    checkpoint = {'record': 0, 'imported': 0, 'rejected': 0} if restart else read_checkpoint(path)
+    skipped = checkpoint['record']
+    roles = role_table()
+    admin_email = normalize_email(current_app.config['FLASKY_ADMIN'])
+    imported = rejected = 0
+
+    pending = set()
+    records = validate(islice(read_records(path, format), skipped, None), pending)
+    with open(rejects_path(path), 'a' if skipped else 'w', encoding='utf-8') as rejects:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+
+            accepted = [record for _, record, errors in batch if errors is None]
+            hashes = password_hasher.hash_many([record['password'] for record in accepted], workers)
+            now = datetime.utcnow()
+            rows = []
+            for record, password_hash in zip(accepted, hashes):
+                email = normalize_email(record['email'])
+                role = roles.admin if email == admin_email and roles.admin is not None else roles.default
+                rows.append({'email': email, 'username': record['username'], 'password_hash': password_hash,
+                             'role_id': role.id if role else None, 'confirmed': confirmed,
+                             'member_since': now, 'last_seen': now,
+                             'avatar_hash': hashlib.md5(email.encode('utf-8')).hexdigest(),
+                             **{field: record.get(field) or None for field in OPTIONAL_FIELDS}})
+            if rows:
+                db.session.execute(User.__table__.insert(), rows)
+            db.session.commit()
+            for row in rows:
+                existence_index.add(row['username'], row['email'])
+            pending.clear()
+
+            for number, record, errors in batch:
+                if errors is not None:
+                    record = {key: value for key, value in (record or {}).items() if key != 'password'}
+                    rejects.write(json.dumps({'record': number, 'data': record, 'errors': errors}) + '\n')
+            rejects.flush()
+
+            imported += len(rows)
+            rejected += len(batch) - len(rows)
+            checkpoint = {'record': batch[-1][0], 'imported': checkpoint['imported'] + len(rows),
+                          'rejected': checkpoint['rejected'] + len(batch) - len(rows)}
+            write_checkpoint(path, checkpoint)
+            if log is not None:
+                log(f"Record {checkpoint['record']}: {checkpoint['imported']} imported, "
+                    f"{checkpoint['rejected']} rejected, {imported / (time.perf_counter() - started):.0f} rows/s")
+
+    if os.path.exists(checkpoint_path(path)):
+        os.remove(checkpoint_path(path))
+    user_cache.clear()
+    seconds = time.perf_counter() - started
+    return {'imported': imported, 'rejected': rejected, 'skipped': skipped, 'seconds': round(seconds, 3),
+            'rows_per_second': round(imported / max(seconds, 1e-9), 1)}
@@ -1,7 +1,8 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, TextAreaField, BooleanField, SelectField
 from wtforms.validators import DataRequired, Length, Email, Regexp, ValidationError
-from ..models import Role, User
+from .. import existence_index
+from ..models import role_table, normalize_email
 
 class NameForm(FlaskForm):
     name = StringField('What is your name?', validators=[DataRequired()])
@@ -29,16 +30,15 @@ class EditProfileAdminForm(FlaskForm):
 
     def __init__(self, user, *args, **kwargs):
         super(EditProfileAdminForm, self).__init__(*args, **kwargs)
-        self.role.choices = [(role.id, role.name)
-                             for role in Role.query.order_by(Role.name).all()]
+        self.role.choices = role_table().choices()
         self.user = user
 
     def validate_email(self, field):
-        if field.data != self.user.email and \
-                User.query.filter_by(email=field.data).first():
+        if normalize_email(field.data) != self.user.email and \
+                existence_index.email_taken(field.data):
             raise ValidationError('Email already registered.')
 
     def validate_username(self, field):
         if field.data != self.user.username and \
-                User.query.filter_by(username=field.data).first():
+                existence_index.username_taken(field.data):
             raise ValidationError('Username already in user.')
@@ -1,13 +1,21 @@
-from flask import render_template, session, redirect, url_for, current_app, flash
+import hashlib
+import os
+import re
+from flask import render_template, session, redirect, url_for, current_app, flash, abort, send_file, \
+    request, make_response
+from markupsafe import Markup
+from sqlalchemy.exc import IntegrityError
+from werkzeug.http import is_resource_modified
 from flask_login import login_required, current_user
-from .. import db
-from ..models import User, Role
-from ..email import send_email
+from .. import db, user_cache, new_user_digest, profile_cache, existence_index
+from ..models import User, normalize_email
 from . import main
 from .forms import NameForm, EditProfileForm, EditProfileAdminForm
-from ..decorators import admin_required
+from ..decorators import admin_required, read_only
+from .. import identicon
 
 @main.route('/', methods=['GET', 'POST'])
+@read_only
 def index():
     form = NameForm()
     if form.validate_on_submit():
@@ -16,12 +24,11 @@ def index():
         if user is None:
             user = User(username=form.name.data)
             db.session.add(user)
-            db.session.commit()
             session['known'] = False
 
             if current_app.config['FLASKY_ADMIN']:
-                send_email(current_app.config['FLASKY_ADMIN'], 'New User',
-                           'mail/new_user', user=user)
+                new_user_digest.add(user)
+            db.session.commit()
         else:
             session['known'] = True
 
@@ -35,9 +42,62 @@ def index():
         known=session.get('known', False))
 
 @main.route('/user/<username>')
+@read_only
 def user(username):
-    user_profile = User.query.filter_by(username=username).first_or_404()
-    return render_template('user.html', user=user_profile)
+    """ Profile page. The profile part is rendered once per viewer class and cached in ``profile_cache``,
+    only the surrounding page (navbar, flashed messages) is rendered per request. The ETag combines the
+    cached profile with the viewer's navbar, so unchanged pages are answered with 304 Not Modified.
+    Pages showing flashed messages get no validators and are not stored. """
+    viewer = profile_cache.viewer_class(current_user, username)
+    fragment = profile_cache.get((username, viewer))
+
+    if fragment is None:
+        # Unknown names, e.g. from scrapers, are answered from the existence index without a query
+        if not existence_index.username_may_exist(username):
+            abort(404)
+        user_profile = User.query.filter_by(username=username).first_or_404()
+        fragment = profile_cache.store(username, viewer,
+                                       render_template('_user_profile.html', user=user_profile))
+
+    if session.get('_flashes'):
+        # Flashed messages are shown once, so this page is neither validated nor stored
+        response = make_response(render_template('user.html', username=username,
+                                                 profile=Markup(fragment.html)))
+        response.cache_control.no_store = True
+        response.cache_control.private = True
+        return response
+
+    navbar = f'{current_user.username}:{current_user.avatar_hash}' \
+        if current_user.is_authenticated else 'anonymous'
+    etag = f'{fragment.etag}-{hashlib.md5(navbar.encode("utf-8")).hexdigest()[:16]}'
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=fragment.rendered_at):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render_template('user.html', username=username,
+                                                 profile=Markup(fragment.html)))
+
+    response.set_etag(etag)
+    response.last_modified = fragment.rendered_at
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+@main.route('/avatar/<hash>/<int:size>')
+def avatar(hash, size):
+    """ Serves the locally generated identicon for an avatar hash. Each (hash, size) pair is rendered
+    once into ``FLASKY_AVATAR_CACHE_DIR`` and never changes, so it is served as immutable. """
+    if not re.fullmatch('[0-9a-f]{32}', hash) or not 16 <= size <= 512:
+        abort(404)
+
+    cache_dir = current_app.config['FLASKY_AVATAR_CACHE_DIR'] or \
+        os.path.join(current_app.instance_path, 'avatars')
+    response = send_file(identicon.cached_path(cache_dir, hash, size), mimetype='image/png',
+                         etag=f'{hash}-{size}', conditional=True, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @main.route('/edit-profile', methods=['GET', 'POST'])
 @login_required
@@ -49,6 +109,8 @@ def edit_profile():
         current_user.about_me = form.about_me.data
         db.session.add(current_user._get_current_object())
         db.session.commit()
+        user_cache.invalidate(current_user.id)
+        profile_cache.invalidate_user(current_user.username)
         flash('Your profile has been updated.')
         return redirect(url_for('.user', username=current_user.username))
 
@@ -66,16 +128,29 @@ def edit_profile_admin(user_id: int):
     form = EditProfileAdminForm(user=admin)
 
     if form.validate_on_submit():
-        admin.email = form.email.data
+        old_username = admin.username
+        if admin.email != normalize_email(form.email.data):
+            admin.email = form.email.data
+            admin.avatar_hash = admin.gravatar_hash()
         admin.username = form.username.data
         admin.confirmed = form.confirmed.data
-        admin.role = Role.query.get(form.role.data)
+        admin.role_id = form.role.data
         admin.name = form.name.data
         admin.location = form.location.data
         admin.about_me = form.about_me.data
 
         db.session.add(admin)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Taken by a rename on another worker that this worker's existence index hasn't seen yet
+            db.session.rollback()
+            existence_index.invalidate()
+            if form.validate():
+                flash('That username or email has just been taken.')
+            return render_template('edit_profile.html', form=form, user=admin)
+        user_cache.invalidate(admin.id)
+        profile_cache.invalidate_user(old_username, admin.username)
 
         flash('The profile has been updated.')
 
@@ -0,0 +1,259 @@
+""" Request, database pool and email metrics exposed in the Prometheus text format at ``/metrics`` """
+
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from flask import current_app, g, request
+from sqlalchemy import event
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds, +Inf is implicit
+
+HELP = {
+    'flasky_requests_total': ('counter', 'Requests handled, by endpoint, method and status code.'),
+    'flasky_request_duration_seconds': ('histogram', 'Time spent handling requests, by endpoint and method.'),
+    'flasky_requests_in_flight': ('gauge', 'Requests being handled right now.'),
+    'flasky_db_pool_checkouts_total': ('counter', 'Connections checked out of the pool, by bind.'),
+    'flasky_db_pool_checked_out': ('gauge', 'Connections currently checked out of the pool, by bind.'),
+    'flasky_mail_queue_depth': ('gauge', 'Emails waiting in the in-process mail pool.'),
+    'flasky_mail_sent_total': ('counter', 'Emails sent by the in-process mail pool.'),
+    'flasky_mail_failed_total': ('counter', 'Emails the in-process mail pool failed to send.'),
+    'flasky_outbox_pending': ('gauge', 'Emails waiting in the outbox table.'),
+    'flasky_workers': ('gauge', 'Worker processes that reported metrics.'),
+}
+
+class _MetricsState:
+    def __init__(self, app):
+        self.directory = app.config['FLASKY_METRICS_DIR']
+        self.flush_interval = app.config['FLASKY_METRICS_FLUSH_INTERVAL']
+        self.counters = defaultdict(float)
+        self.gauges = defaultdict(float)
+        self.histograms = {} # key -> [count per bucket..., count above the last bucket, sum]
+        self.lock = threading.Lock()
+        self.flushed_at = 0
+
+    def inc(self, name, labels=(), value=1.0):
+        with self.lock:
+            self.counters[(name, labels)] += value
+
+    def add(self, name, labels=(), value=1.0):
+        with self.lock:
+            self.gauges[(name, labels)] += value
+
+    def set(self, name, labels=(), value=0.0):
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(BUCKETS, value)] += 1
+            histogram[-1] += value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, list(labels), values] for (name, labels), values in self.histograms.items()],
+            }
+
+    def flush(self):
+        """ Writes this worker's snapshot to ``<directory>/<pid>.json``, atomically """
+        self.flushed_at = time.monotonic()
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def snapshots(self) -> list:
+        """ The latest snapshot of every worker, this one's taken live """
+        snapshots = [self.snapshot()]
+        if self.directory is None or not os.path.isdir(self.directory):
+            return snapshots
+
+        for file in os.listdir(self.directory):
+            if not file.endswith('.json') or file == f'{os.getpid()}.json':
+                continue
+            try:
+                with open(os.path.join(self.directory, file)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue # Replaced or removed while reading
+            if not _alive(snapshot['pid']):
+                snapshot['gauges'] = [] # A dead worker's counts still add up, its gauges no longer do
+            snapshots.append(snapshot)
+        return snapshots
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Metrics:
+    """ Records request latency histograms, status code counters, in-flight requests, connection
+    pool checkouts and mail queue depth, and serves them at ``/metrics`` for Prometheus.
+
+    Pre-fork servers run one copy of the app per worker process, and a scrape only reaches one
+    of them. With ``FLASKY_METRICS_DIR`` set every worker therefore writes its numbers to that
+    directory at most every ``FLASKY_METRICS_FLUSH_INTERVAL`` seconds and at exit, and
+    ``/metrics`` adds up the files of all workers. Counters of workers that exited keep counting,
+    as Prometheus expects, while their gauges are dropped. Clear the directory when deploying.
+    Without it the metrics of the serving process alone are reported.
+
+    Requests are labelled by endpoint rather than path, so ``/user/<username>`` is one series.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        app.config.setdefault('FLASKY_METRICS', True)
+        app.config.setdefault('FLASKY_METRICS_DIR', None)
+        app.config.setdefault('FLASKY_METRICS_FLUSH_INTERVAL', 5)
+        if not app.config['FLASKY_METRICS']:
+            return
+
+        state = app.extensions['metrics'] = _MetricsState(app)
+        with app.app_context():
+            engines = dict(db.engines)
+        for bind, engine in engines.items():
+            labels = (('bind', bind or 'primary'),)
+            event.listen(engine, 'checkout', lambda *args, labels=labels: self._checkout(state, labels))
+            event.listen(engine, 'checkin', lambda *args, labels=labels: self._checkin(state, labels))
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+        if state.directory is not None:
+            atexit.register(state.flush)
+
+    @staticmethod
+    def _checkout(state, labels):
+        state.inc('flasky_db_pool_checkouts_total', labels)
+        state.add('flasky_db_pool_checked_out', labels, 1)
+
+    @staticmethod
+    def _checkin(state, labels):
+        state.add('flasky_db_pool_checked_out', labels, -1)
+
+    @property
+    def state(self) -> _MetricsState:
+        return current_app.extensions['metrics']
+
+    def before_request(self):
+        g.metrics_started = time.perf_counter()
+        self.state.add('flasky_requests_in_flight')
+
+    @staticmethod
+    def after_request(response):
+        g.metrics_status = response.status_code
+        return response
+
+    def teardown_request(self, exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+
+        state = self.state
+        endpoint = request.url_rule.endpoint if request.url_rule else '<unmatched>'
+        status = g.pop('metrics_status', 500)
+        state.add('flasky_requests_in_flight', (), -1)
+        state.inc('flasky_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', str(status))))
+        state.observe('flasky_request_duration_seconds', (('endpoint', endpoint), ('method', request.method)),
+                      time.perf_counter() - started)
+
+        if time.monotonic() - state.flushed_at >= state.flush_interval:
+            self.collect_mail(state)
+            state.flush()
+
+    @staticmethod
+    def collect_mail(state):
+        from .email import mail_pool
+
+        stats = mail_pool.stats()
+        state.set('flasky_mail_queue_depth', (), stats['queue_depth'])
+        with state.lock:
+            state.counters[('flasky_mail_sent_total', ())] = stats['sent']
+            state.counters[('flasky_mail_failed_total', ())] = stats['failed']
+
+    def view(self):
+        state = self.state
+        self.collect_mail(state)
+        state.flush()
+        body = render(state.snapshots(), self.outbox_pending())
+        return current_app.response_class(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    @staticmethod
+    def outbox_pending():
+        from . import db
+        from .models import OutboxEmail
+
+        if not current_app.config['FLASKY_MAIL_OUTBOX']:
+            return None
+        return db.session.scalar(db.select(db.func.count(OutboxEmail.id)).where(OutboxEmail.status == 'pending'))
+
+def render(snapshots: list, outbox_pending: int = None) -> str:
+    """ Adds up the snapshots of all workers in the Prometheus text exposition format """
+    counters, gauges, histograms = defaultdict(float), defaultdict(float), {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, value in snapshot['gauges']:
+            gauges[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, values in snapshot['histograms']:
+            total = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+
+    gauges[('flasky_workers', ())] = sum(1 for snapshot in snapshots if _alive(snapshot['pid']))
+    if outbox_pending is not None:
+        gauges[('flasky_outbox_pending', ())] = outbox_pending
+
+    lines = []
+    for name, (kind, description) in HELP.items():
+        samples = []
+        if kind == 'histogram':
+            for (sample_name, labels), values in sorted(histograms.items()):
+                if sample_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), values[:-1]):
+                    cumulative += count
+                    samples.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+                samples.append(f'{name}_sum{_labels(labels)} {values[-1]}')
+                samples.append(f'{name}_count{_labels(labels)} {cumulative}')
+        else:
+            series = counters if kind == 'counter' else gauges
+            samples = [f'{name}{_labels(labels)} {_number(value)}'
+                       for (sample_name, labels), value in sorted(series.items()) if sample_name == name]
+
+        if samples:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}'] + samples
+    return '\n'.join(lines) + '\n'
+
+def _labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
@@ -1,13 +1,20 @@
 """ Module contains each of the different models used to represent objects in the database """
 
 import hashlib
+import time
+from collections import namedtuple
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+from types import MappingProxyType
 from flask_login import UserMixin, AnonymousUserMixin
-from flask import current_app
+from flask import current_app, has_app_context, url_for
+from sqlalchemy import event
+from sqlalchemy.orm import validates, object_session
+from sqlalchemy.orm.attributes import set_committed_value
 import jwt
 from app import db
-from . import loginManager
+from . import loginManager, ping_buffer, user_cache, password_hasher, existence_index
+from .replica import RoutingSession
 
 class Permission:
     FOLLOW = 1
@@ -16,6 +23,11 @@ class Permission:
     MODERATE = 8
     ADMIN = 16
 
+def normalize_email(email):
+    """ Canonical form emails are stored and looked up in, so ``ix_users_email`` serves
+    case-insensitive matches without an expression index """
+    return email.strip().lower() if email is not None else None
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -29,16 +41,25 @@ class User(UserMixin, db.Model):
     about_me = db.Column(db.Text())
     member_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
-    avatar_hash = db.column(db.String(32))
+    avatar_hash = db.Column(db.String(32), index=True)
+    # Last change of username or email, so other workers' existence indexes can catch up on renames
+    renamed_at = db.Column(db.DateTime(), index=True)
+
+    # Seek pagination of the admin user directory, newest first, with or without a role filter
+    __table_args__ = (db.Index('ix_users_member_since_id', 'member_since', 'id'),
+                      db.Index('ix_users_last_seen_id', 'last_seen', 'id'),
+                      db.Index('ix_users_role_id_member_since_id', 'role_id', 'member_since', 'id'),
+                      db.Index('ix_users_role_id_last_seen_id', 'role_id', 'last_seen', 'id'))
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
 
-        if self.role is None:
-            if self.email == current_app.config['FLASKY_ADMIN']:
-                self.role = Role.query.filter_by(name='Administrator').first()
-            if self.role is None:
-                self.role = Role.query.filter_by(default=True).first()
+        if self.role_id is None and self.role is None:
+            roles = role_table()
+            if self.email == normalize_email(current_app.config['FLASKY_ADMIN']) and roles.admin is not None:
+                self.role_id = roles.admin.id
+            if self.role_id is None and roles.default is not None:
+                self.role_id = roles.default.id
                 
         if self.email is not None and self.avatar_hash is None:
             self.avatar_hash = self.gravatar_hash()
@@ -46,16 +67,32 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+    @validates('email')
+    def validate_email(self, key, email):
+        return normalize_email(email)
+
+    @staticmethod
+    def find_by_email(email):
+        """ The user registered with ``email`` in any case, or None. Every lookup by email goes
+        through here so it is always an equality match on the indexed, normalized column. """
+        if not email:
+            return None
+        return User.query.filter_by(email=normalize_email(email)).first()
+
     @property
     def password(self):
         raise AttributeError('password is not a readable attribute')
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self) -> bool:
+        """ Whether the stored hash was made with an outdated ``FLASKY_PASSWORD_HASH_METHOD`` """
+        return self.password_hash is not None and password_hasher.needs_rehash(self.password_hash)
 
     def generate_confirmation_token(self, expiration=3600):
         secret_key = current_app.config['SECRET_KEY']
@@ -108,11 +145,12 @@ class User(UserMixin, db.Model):
         encoded = jwt.encode({'change_email': self.id, 'new_email': new_email,
                               'exp': datetime.now(tz=timezone.utc) + timedelta(seconds=expiration)},
                              secret_key)
-        
+        return encoded
+
     def change_email(self, token):
         secret_key = current_app.config['SECRET_KEY']
         try:
-            data = jwt.decode(token, secret_key)
+            data = jwt.decode(token, secret_key, algorithms=['HS256'])
         except:
             return False
         
@@ -123,7 +161,7 @@ class User(UserMixin, db.Model):
         if new_email is None:
             return False
         
-        if self.query.filter_by(email=new_email).first() is not None:
+        if User.find_by_email(new_email) is not None:
             return False
         
         self.email = new_email
@@ -132,24 +170,49 @@ class User(UserMixin, db.Model):
         return True
 
     def can(self, perm) -> bool:
-        return self.role is not None and self.role.has_permission(perm)
+        if self.role_id is None:
+            # A role assigned to an unsaved user only shows up in role_id after a flush
+            return self.role is not None and self.role.has_permission(perm)
+        return role_table().has_permission(self.role_id, perm)
 
     def is_administrator(self) -> bool:
         return self.can(Permission.ADMIN)
 
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
+        """ Records that the user was just seen. The new timestamp is handed to the write-behind
+        ``ping_buffer`` instead of dirtying the row, so a request that only reads stays read-only. """
+        seen = ping_buffer.record(self.id)
+        set_committed_value(self, 'last_seen', seen)
 
     def gravatar_hash(self):
-        return hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
+        return hashlib.md5((self.email or '').lower().encode('utf-8')).hexdigest()
 
     def gravatar(self, size=100, default='identicon', rating='g'):
-        url = 'https://secure.gravatar.com/avatar'
-        hash = hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
-        return '{url}/{hash}?s={size}&d={default}&r={rating}'.format(
-            url=url, hash=hash, size=size, default=default, rating=rating
-        )
+        hash = self.avatar_hash or self.gravatar_hash()
+        if current_app.config['FLASKY_LOCAL_AVATARS']:
+            return url_for('main.avatar', hash=hash, size=size)
+        return gravatar_url(hash, size, default, rating)
+
+@event.listens_for(User, 'before_update')
+def _stamp_rename(mapper, connection, target):
+    state = db.inspect(target)
+    if state.attrs.username.history.has_changes() or state.attrs.email.history.has_changes():
+        target.renamed_at = datetime.utcnow()
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+def _index_user_names(mapper, connection, target):
+    """ Keeps the existence index's Bloom filters in step with the users this worker writes """
+    if has_app_context() and 'existence_index' in current_app.extensions:
+        existence_index.add(target.username, target.email)
+
+@lru_cache(maxsize=4096)
+def gravatar_url(hash, size, default, rating) -> str:
+    """ Memoized Gravatar URL, templates ask for the same few (hash, size) pairs on every page """
+    url = 'https://secure.gravatar.com/avatar'
+    return '{url}/{hash}?s={size}&d={default}&r={rating}'.format(
+        url=url, hash=hash, size=size, default=default, rating=rating
+    )
 
 class AnonymousUser(AnonymousUserMixin):
     def can(self, permissions):
@@ -216,11 +279,76 @@ class Role(db.Model):
             db.session.add(role)
 
         db.session.commit()
+        refresh_role_table()
+
+RoleInfo = namedtuple('RoleInfo', ['id', 'name', 'permissions', 'default'])
+
+class RoleTable:
+    """ Immutable snapshot of the ``roles`` table, so permission checks, role choices and
+    new users can resolve roles without querying the database. """
+
+    def __init__(self, roles):
+        self.loaded_at = time.monotonic()
+        self.roles = tuple(sorted(roles, key=lambda role: role.name))
+        self.by_id = MappingProxyType({role.id: role for role in self.roles})
+        self.by_name = MappingProxyType({role.name: role for role in self.roles})
+        self.default = next((role for role in self.roles if role.default), None)
+        self.admin = self.by_name.get('Administrator')
+
+    def has_permission(self, role_id: int, perm) -> bool:
+        role = self.by_id.get(role_id)
+        return role is not None and role.permissions & perm == perm
+
+    def choices(self) -> list:
+        """ (id, name) pairs ordered by name, as used by role ``SelectField``s """
+        return [(role.id, role.name) for role in self.roles]
+
+    @classmethod
+    def load(cls):
+        rows = db.session.execute(
+            db.select(Role.id, Role.name, Role.permissions, Role.default)).all()
+        return cls(RoleInfo(row.id, row.name, row.permissions or 0, bool(row.default))
+                   for row in rows)
+
+def role_table() -> RoleTable:
+    """ Returns the current app's ``RoleTable``, loading it on first use and reloading it
+    after ``FLASKY_ROLE_TABLE_TTL`` seconds, which bounds how long role edits made on another
+    worker take to show up here """
+    table = current_app.extensions.get('role_table')
+    ttl = current_app.config.get('FLASKY_ROLE_TABLE_TTL', 30)
+    if table is None or time.monotonic() - table.loaded_at > ttl:
+        table = refresh_role_table()
+    return table
+
+def refresh_role_table() -> RoleTable:
+    """ Reloads the current app's ``RoleTable`` from the database """
+    table = RoleTable.load()
+    current_app.extensions['role_table'] = table
+    return table
+
+@event.listens_for(Role, 'after_insert')
+@event.listens_for(Role, 'after_update')
+@event.listens_for(Role, 'after_delete')
+def _record_role_write(mapper, connection, target):
+    """ Flags the session, whose commit or rollback then drops the cached ``RoleTable``. Dropping
+    it at flush would let a lookup in the same transaction cache rows that may be rolled back. """
+    db_session = object_session(target)
+    if db_session is not None:
+        db_session.info['roles_written'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+@event.listens_for(RoutingSession, 'after_rollback')
+def _invalidate_role_table(db_session):
+    """ Drops the cached ``RoleTable`` once a transaction that wrote roles ends, so the next
+    lookup reloads it. On rollback this also discards a table loaded from uncommitted rows. """
+    if db_session.info.pop('roles_written', False) and has_app_context():
+        current_app.extensions.pop('role_table', None)
 
 @loginManager.user_loader
 def load_user(user_id: str) -> User:
     """ Function required by Flask-Login to be invoked when the extension needs to load
-    a user from the database given its identifier
+    a user from the database given its identifier. Users are served from the per-worker
+    ``user_cache`` so most requests don't query the ``users`` or ``roles`` tables.
 
     Args:
         user_id (string): id of the user to retrieve info for
@@ -228,5 +356,39 @@ def load_user(user_id: str) -> User:
     Returns:
         User: User model containing data associated with user_id
     """
-    return User.query.get(int(user_id))
+    return user_cache.load(int(user_id))
 
+
+class OutboxEmail(db.Model):
+    """ Email waiting in the outbox to be delivered by ``flask mail-worker``.
+    Rows are added to the session of the request that sends the email, so they are
+    committed (or rolled back) together with the rest of the view's changes. """
+    __tablename__ = 'outbox'
+    __table_args__ = (db.Index('ix_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.String(128))
+    recipients = db.Column(db.JSON)
+    subject = db.Column(db.String(256))
+    body = db.Column(db.Text())
+    html = db.Column(db.Text())
+    status = db.Column(db.String(16), default='pending')
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text())
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    claimed_by = db.Column(db.String(64))
+    claimed_at = db.Column(db.DateTime())
+    sent_at = db.Column(db.DateTime())
+
+    def __repr__(self):
+        return f'<OutboxEmail {self.id} {self.status}>'
+
+    @staticmethod
+    def from_message(msg):
+        return OutboxEmail(sender=msg.sender, recipients=list(msg.recipients),
+                           subject=msg.subject, body=msg.body, html=msg.html)
+
+    def to_message(self):
+        from flask_mail import Message
+        return Message(self.subject, sender=self.sender, recipients=self.recipients,
+                       body=self.body, html=self.html)
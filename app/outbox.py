@@ -0,0 +1,127 @@
+""" Delivery of the emails queued in the ``outbox`` table, run by the ``flask mail-worker`` command """
+
+import os
+import smtplib
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import SQLAlchemyError
+from . import db, mail
+from .models import OutboxEmail
+
+def worker_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+def backoff(attempts: int) -> timedelta:
+    """ Delay before the next delivery attempt, doubling with every failed attempt """
+    base = current_app.config['FLASKY_OUTBOX_BACKOFF']
+    ceiling = current_app.config['FLASKY_OUTBOX_MAX_BACKOFF']
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), ceiling))
+
+def claim_batch(worker: str, size: int) -> list:
+    """ Claims up to ``size`` due emails for ``worker`` in a single UPDATE, so concurrent workers
+    never claim the same row. Claims older than ``FLASKY_OUTBOX_LEASE`` seconds are considered
+    abandoned by a crashed worker and can be claimed again.
+
+    Returns:
+        list: the claimed ``OutboxEmail`` rows
+    """
+    now = datetime.utcnow()
+    expired = now - timedelta(seconds=current_app.config['FLASKY_OUTBOX_LEASE'])
+    due = db.select(OutboxEmail.id) \
+        .where(OutboxEmail.status == 'pending',
+               OutboxEmail.next_attempt_at <= now,
+               or_(OutboxEmail.claimed_at.is_(None), OutboxEmail.claimed_at < expired)) \
+        .order_by(OutboxEmail.next_attempt_at, OutboxEmail.id) \
+        .limit(size)
+
+    db.session.execute(db.update(OutboxEmail)
+                       .where(OutboxEmail.id.in_(due.scalar_subquery()))
+                       .values(claimed_by=worker, claimed_at=now)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+
+    return OutboxEmail.query.filter_by(claimed_by=worker, status='pending') \
+        .order_by(OutboxEmail.id).all()
+
+def deliver(batch: list) -> tuple:
+    """ Sends a claimed batch over one SMTP connection and records the outcome of every email.
+
+    Returns:
+        tuple: number of emails sent and number of emails that failed
+    """
+    max_attempts = current_app.config['FLASKY_OUTBOX_MAX_ATTEMPTS']
+    sent = failed = 0
+    connection = None
+
+    try:
+        for email in batch:
+            now = datetime.utcnow()
+            try:
+                if connection is None:
+                    connection = mail.connect().__enter__()
+                connection.send(email.to_message())
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                # The server rejected this message, the session itself is still usable
+                _record_failure(email, e, now, max_attempts)
+                failed += 1
+            except Exception as e:
+                if isinstance(e, OSError):
+                    connection = _disconnect(connection)
+                _record_failure(email, e, now, max_attempts)
+                failed += 1
+            else:
+                email.status = 'sent'
+                email.sent_at = now
+                sent += 1
+
+            email.claimed_by = None
+            email.claimed_at = None
+    finally:
+        _disconnect(connection)
+        db.session.commit()
+
+    return sent, failed
+
+def run_worker(batch_size: int, poll_interval: float, once: bool = False, log=print):
+    """ Claims and delivers batches until interrupted, sleeping ``poll_interval`` seconds whenever
+    the outbox has nothing due. With ``once`` it stops as soon as the outbox is drained.
+    Database errors, such as a locked SQLite file, are logged and retried after ``poll_interval``;
+    emails claimed before the error are claimed again once their lease expires. """
+    worker = worker_id()
+
+    while True:
+        try:
+            batch = claim_batch(worker, batch_size)
+            if batch:
+                sent, failed = deliver(batch)
+                log(f'{worker}: sent {sent}, failed {failed}')
+                continue
+        except SQLAlchemyError:
+            db.session.rollback()
+            current_app.logger.exception('%s: outbox query failed, retrying in %ss', worker, poll_interval)
+            time.sleep(poll_interval)
+            continue
+
+        if once:
+            return
+        time.sleep(poll_interval)
+
+def _record_failure(email: OutboxEmail, error: Exception, now: datetime, max_attempts: int):
+    email.attempts = (email.attempts or 0) + 1
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = now + backoff(email.attempts)
+
+def _disconnect(connection):
+    if connection is not None:
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            pass
+    return None
@@ -0,0 +1,112 @@
+""" Write-behind buffer for the ``last_seen`` timestamps recorded by ``User.ping()`` """
+
+import atexit
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam
+
+class _PingState:
+    """ Pending ``last_seen`` values and flush timer of one application """
+
+    def __init__(self, app):
+        self.app = app
+        self.flush_interval = app.config['FLASKY_PING_FLUSH_INTERVAL']
+        self.flush_size = app.config['FLASKY_PING_FLUSH_SIZE']
+        self.pending = {}
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def record(self, user_id: int, when: datetime):
+        with self.lock:
+            self.pending[user_id] = when
+            due = len(self.pending) >= self.flush_size or self.flush_interval <= 0
+            if not due and self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        if batch:
+            with self.app.app_context():
+                _write(batch)
+        return len(batch)
+
+class PingBuffer:
+    """ Collects ``last_seen`` updates in memory and writes them to the ``users`` table in bulk.
+
+    Pings are deduplicated by user id, so a user who loads ten pages between two flushes costs
+    a single row in the next UPDATE. The buffer of each app is flushed when it holds
+    ``FLASKY_PING_FLUSH_SIZE`` users, by a timer ``FLASKY_PING_FLUSH_INTERVAL`` seconds after
+    the first ping it holds, even if no request follows, and at interpreter shutdown.
+    An interval of 0 writes every ping straight through.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_PING_FLUSH_INTERVAL', 30)
+        app.config.setdefault('FLASKY_PING_FLUSH_SIZE', 500)
+        state = _PingState(app)
+        app.extensions['ping_buffer'] = state
+        atexit.register(state.flush)
+
+    @property
+    def state(self) -> _PingState:
+        return current_app.extensions['ping_buffer']
+
+    def record(self, user_id: int, when: datetime = None) -> datetime:
+        """ Queues a ``last_seen`` update for ``user_id`` and flushes the buffer if it is full.
+
+        Args:
+            user_id (int): id of the user that was seen
+            when (datetime, optional): time the user was seen, defaults to ``datetime.utcnow()``
+
+        Returns:
+            datetime: the timestamp that was recorded
+        """
+        when = when or datetime.utcnow()
+        self.state.record(user_id, when)
+        return when
+
+    def pending(self) -> int:
+        """ Number of users with an unwritten ``last_seen`` value """
+        state = self.state
+        with state.lock:
+            return len(state.pending)
+
+    def flush(self) -> int:
+        """ Writes every pending ``last_seen`` value in one executemany UPDATE on its own connection,
+        so the request's session and transaction are left untouched.
+
+        Returns:
+            int: number of users written
+        """
+        return self.state.flush()
+
+def _write(batch):
+    from . import db
+    from .models import User
+
+    users = User.__table__
+    statement = users.update() \
+        .where(users.c.id == bindparam('user_id')) \
+        .values(last_seen=bindparam('seen'))
+
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(statement, [{'user_id': user_id, 'seen': seen}
+                                           for user_id, seen in batch.items()])
+    except Exception:
+        current_app.logger.exception('Failed to write %d last_seen updates', len(batch))
@@ -0,0 +1,45 @@
+""" PRAGMA settings applied to every new connection of the application's SQLite engines """
+
+from sqlalchemy import event
+
+class SQLitePragmas:
+    """ Runs ``PRAGMA <name> = <value>`` for every entry of ``FLASKY_SQLITE_PRAGMAS`` on each
+    connection the SQLite engines open, before the pool hands it out.
+
+    Most of these settings only last as long as the connection, so setting them once from a
+    shell is not enough. ``journal_mode = WAL`` is the one that matters for concurrency: readers
+    keep reading the last committed snapshot while a writer appends to the log, instead of
+    waiting on the database lock. Engines for other databases are left alone.
+
+    Must be initialized after ``db``, whose engines it attaches to.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        app.config.setdefault('FLASKY_SQLITE_PRAGMAS', {})
+        pragmas = dict(app.config['FLASKY_SQLITE_PRAGMAS'])
+        app.extensions['sqlite_pragmas'] = pragmas
+        if not pragmas:
+            return
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', self.connect_listener(pragmas))
+
+    @staticmethod
+    def connect_listener(pragmas: dict):
+        def on_connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f'PRAGMA {name} = {value}')
+            finally:
+                cursor.close()
+        return on_connect
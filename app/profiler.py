@@ -0,0 +1,159 @@
+""" On-demand CPU profiles of single requests, armed by an administrator """
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from flask import current_app, g, request, session
+
+SESSION_KEY = '_profile_next'
+MODES = ('cprofile', 'sampling')
+
+class Sampler:
+    """ Thread recording the stack of another thread every ``interval`` seconds, as collapsed
+    stacks: one ``outer;...;inner`` line per distinct stack with the number of samples """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+class RequestProfiler:
+    """ Profiles the next request an administrator makes to an armed path.
+
+    ``arm(path, mode)`` stores the target in the administrator's session, so the profiled
+    request can land on any worker. ``cprofile`` mode writes the ``pstats`` file and a text
+    report of the top functions; ``sampling`` mode samples the request thread every
+    ``FLASKY_PROFILE_SAMPLE_INTERVAL`` seconds and writes collapsed stacks, the input of
+    flamegraph.pl and speedscope. Profiles go to ``FLASKY_PROFILE_DIR``, by default
+    ``<instance>/profiles``, where only the last ``FLASKY_PROFILE_KEEP`` are kept.
+
+    When nothing is armed, the cost per request is one lookup in the session.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_PROFILE_DIR', None)
+        app.config.setdefault('FLASKY_PROFILE_KEEP', 50)
+        app.config.setdefault('FLASKY_PROFILE_SAMPLE_INTERVAL', 0.001)
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    @staticmethod
+    def profile_dir(app=None) -> str:
+        app = app or current_app
+        return app.config['FLASKY_PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+    @staticmethod
+    def arm(path: str, mode: str):
+        """ Profiles the current user's next request to ``path`` """
+        if mode not in MODES:
+            raise ValueError(f'Unknown profiler mode {mode!r}')
+        session[SESSION_KEY] = {'path': path, 'mode': mode}
+
+    @staticmethod
+    def before_request():
+        armed = session.get(SESSION_KEY)
+        if armed is None or armed['path'] != request.full_path.rstrip('?'):
+            return
+
+        session.pop(SESSION_KEY)
+        if armed['mode'] == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = Sampler(threading.get_ident(), current_app.config['FLASKY_PROFILE_SAMPLE_INTERVAL'])
+            profiler.start()
+        g.profile = (armed['mode'], profiler, time.perf_counter())
+
+    def teardown_request(self, exc):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+
+        mode, profiler, started = profile
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+        self.save(mode, profiler, time.perf_counter() - started)
+
+    def save(self, mode, profiler, duration: float):
+        directory = self.profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        created = datetime.now(timezone.utc)
+        name = f"{created:%Y%m%dT%H%M%S%f}-{(request.endpoint or 'unknown').replace('.', '-')}"
+
+        files = []
+        if mode == 'cprofile':
+            profiler.dump_stats(os.path.join(directory, f'{name}.pstats'))
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+            with open(os.path.join(directory, f'{name}.txt'), 'w') as f:
+                f.write(report.getvalue())
+            files += [f'{name}.pstats', f'{name}.txt']
+        else:
+            with open(os.path.join(directory, f'{name}.collapsed'), 'w') as f:
+                f.write(profiler.collapsed())
+            files.append(f'{name}.collapsed')
+
+        with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+            json.dump({'name': name, 'mode': mode, 'method': request.method, 'path': request.full_path.rstrip('?'),
+                       'endpoint': request.endpoint, 'duration_ms': round(duration * 1000, 3),
+                       'created': created.isoformat(), 'files': files}, f)
+        self.prune(directory)
+
+    @staticmethod
+    def profiles(directory: str = None) -> list:
+        """ Metadata of the stored profiles, newest first """
+        directory = directory or RequestProfiler.profile_dir()
+        if not os.path.isdir(directory):
+            return []
+
+        profiles = []
+        for file in sorted(os.listdir(directory), reverse=True):
+            if file.endswith('.json'):
+                with open(os.path.join(directory, file)) as f:
+                    profiles.append(json.load(f))
+        return profiles
+
+    @classmethod
+    def prune(cls, directory: str):
+        for profile in cls.profiles(directory)[current_app.config['FLASKY_PROFILE_KEEP']:]:
+            for file in profile['files'] + [profile['name'] + '.json']:
+                try:
+                    os.remove(os.path.join(directory, file))
+                except FileNotFoundError:
+                    pass
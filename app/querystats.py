@@ -0,0 +1,159 @@
+""" Per-request counts and timings of the SQL statements sent to the database """
+
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, render_template, request
+from sqlalchemy import event
+
+class QueryLog:
+    """ Statements executed during one request, or inside ``QueryStats.capture()`` """
+
+    def __init__(self):
+        self.queries = [] # (statement, seconds) in execution order
+
+    def add(self, statement: str, duration: float):
+        self.queries.append((statement, duration))
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def duration(self) -> float:
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold: int) -> list:
+        """ Statements executed at least ``threshold`` times, most repeated first. The SQL text is
+        parameterized, so repeats of one statement with different ids share a single shape.
+
+        Returns:
+            list: (statement, count) pairs
+        """
+        if threshold <= 0:
+            return []
+        return [(statement, count) for statement, count in Counter(s for s, _ in self.queries).most_common()
+                if count >= threshold]
+
+class QueryStats:
+    """ Counts and times every statement the app's engines execute during a request.
+
+    The totals are sent in a ``Server-Timing`` header, which browser developer tools show next
+    to the request. With ``FLASKY_QUERY_PANEL`` HTML pages also get a panel listing each statement.
+    A statement shape executed ``FLASKY_QUERY_N_PLUS_ONE`` times in one request is logged as a
+    probable N+1 query, usually a lazy-loaded relationship inside a loop.
+
+    Tests assert query budgets with ``capture()``::
+
+        with query_stats.capture() as log:
+            client.get('/user/john')
+        self.assertLessEqual(log.count, 2)
+
+    Must be initialized after ``db``, whose engines it attaches to, and after ``compress`` so the
+    panel is added before the body is compressed.
+    """
+
+    def __init__(self, app=None):
+        self.listeners = [] # Called with (cursor, statement, parameters, seconds, executemany) after each statement
+        self._captures = []
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import db
+
+        app.config.setdefault('FLASKY_QUERY_STATS', True)
+        app.config.setdefault('FLASKY_QUERY_PANEL', False)
+        app.config.setdefault('FLASKY_QUERY_N_PLUS_ONE', 5)
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    @contextmanager
+    def capture(self):
+        """ Collects the statements executed by any thread while the block runs """
+        log = QueryLog()
+        with self._lock:
+            self._captures.append(log)
+        try:
+            yield log
+        finally:
+            with self._lock:
+                self._captures.remove(log)
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's execution context, which is dropped even when the statement raises.
+        # The rare executions without one, e.g. of column defaults, overwrite a single slot.
+        if context is not None:
+            context.query_started = time.perf_counter()
+        else:
+            conn.info['query_started'] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = context.query_started if context is not None else conn.info.pop('query_started')
+        duration = time.perf_counter() - started
+
+        if has_request_context() and current_app.config['FLASKY_QUERY_STATS']:
+            log = g.get('query_log')
+            if log is None:
+                log = g.query_log = QueryLog()
+            log.add(statement, duration)
+
+        if self._captures:
+            with self._lock:
+                for log in self._captures:
+                    log.add(statement, duration)
+
+        for listener in self.listeners:
+            listener(cursor, statement, parameters, duration, executemany)
+
+    @staticmethod
+    def before_request():
+        g.request_started = time.perf_counter()
+
+    def after_request(self, response):
+        config = current_app.config
+        if not config['FLASKY_QUERY_STATS']:
+            return response
+
+        log = g.get('query_log') or QueryLog()
+        total = time.perf_counter() - g.get('request_started', time.perf_counter())
+        repeated = log.repeated(config['FLASKY_QUERY_N_PLUS_ONE'])
+
+        for statement, count in repeated:
+            current_app.logger.warning('Probable N+1 query in %s, executed %d times: %s',
+                                       request.endpoint, count, statement)
+
+        response.headers.add('Server-Timing', f'db;desc="{log.count} queries";dur={log.duration * 1000:.2f}')
+        response.headers.add('Server-Timing', f'app;dur={total * 1000:.2f}')
+        if repeated:
+            response.headers.add('Server-Timing', f'n-plus-one;desc="{len(repeated)} repeated statements"')
+
+        if config['FLASKY_QUERY_PANEL'] and response.mimetype == 'text/html' \
+                and not response.direct_passthrough and not response.is_streamed:
+            self.add_panel(response, log, repeated, total)
+        return response
+
+    @staticmethod
+    def add_panel(response, log, repeated, total):
+        body = response.get_data(as_text=True)
+        position = body.rfind('</body>')
+        if position < 0:
+            return
+
+        panel = render_template('_query_panel.html', log=log, repeated=dict(repeated), total=total)
+        response.set_data(body[:position] + panel + body[position:])
+        # The panel differs on every request, so the page must not be revalidated or reused
+        response.headers.pop('ETag', None)
+        response.headers.pop('Last-Modified', None)
+        response.cache_control.no_store = True
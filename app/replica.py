@@ -0,0 +1,88 @@
+""" Routing of read-only requests to a read replica of the database """
+
+import time
+from flask import current_app, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+LAST_WRITE_KEY = '_last_write' # Time of the user's last commit, kept in their session cookie
+
+class RoutingSession(Session):
+    """ ``db.session`` class that sends queries to the ``replica`` bind while ``use_replica``
+    is set in its ``info``, which the ``read_only`` view decorator does for GET requests.
+
+    Flushes, and every query after the first flush of the session, go to the primary, so a
+    request never reads around its own writes. Without a ``replica`` bind in
+    ``SQLALCHEMY_BINDS`` everything goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('use_replica') and \
+                not self._flushing and not self.info.get('wrote'):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_flush(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _record_write(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+        session[LAST_WRITE_KEY] = time.time()
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_flush(db_session):
+    db_session.info.pop('wrote', None)
+
+class ReadReplica:
+    """ Settings and maintenance of the ``replica`` bind.
+
+    A user whose last commit is less than ``FLASKY_REPLICA_MAX_LAG`` seconds old keeps reading
+    from the primary, so they see their own changes even though the replica may not have them
+    yet. That makes the lag bound a promise: the replica has to be synced more often than that,
+    e.g. by ``flask replica-sync --interval``, which copies a SQLite primary into a SQLite replica.
+    Responses cached from replica reads can be as old as the replica.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_REPLICA_MAX_LAG', 10)
+
+    def enabled(self) -> bool:
+        from . import db
+        return REPLICA_BIND in db.engines
+
+    def fresh_enough(self) -> bool:
+        """ Whether the current user may read from the replica """
+        last_write = session.get(LAST_WRITE_KEY)
+        return last_write is None or time.time() - last_write > current_app.config['FLASKY_REPLICA_MAX_LAG']
+
+    def sync(self) -> float:
+        """ Copies the primary SQLite database into the replica with SQLite's online backup,
+        which readers of the replica wait out through their busy timeout.
+
+        Returns:
+            float: seconds the copy took
+        """
+        from . import db
+
+        primary, replica = db.engines[None], db.engines[REPLICA_BIND]
+        if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+            raise RuntimeError('Only SQLite replicas are synced by the app, '
+                               'other databases replicate on their own')
+
+        started = time.perf_counter()
+        source, target = primary.raw_connection(), replica.raw_connection()
+        try:
+            source.driver_connection.backup(target.driver_connection)
+        finally:
+            target.close()
+            source.close()
+        return time.perf_counter() - started
@@ -0,0 +1,175 @@
+""" JSONL log of slow SQL statements with their call site and query plan """
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from flask import current_app, has_app_context, has_request_context, request
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+WATCHED_TABLES = ('users', 'roles') # Full scans of these tables are flagged by `flask slow-queries`
+
+class SlowQueryLog:
+    """ Writes every statement slower than ``FLASKY_SLOW_QUERY_THRESHOLD`` seconds to a rotating
+    JSONL file, ``FLASKY_SLOW_QUERY_LOG`` or ``<instance>/slow_queries.jsonl``.
+
+    Each entry holds the statement, the types of its parameters (never their values), the
+    endpoint and the innermost lines of application code that issued it, and, on SQLite, the
+    output of ``EXPLAIN QUERY PLAN``. ``flask slow-queries`` aggregates the log.
+
+    Timings come from ``query_stats``, which must be initialized first.
+    """
+
+    def __init__(self, app=None):
+        self._loggers = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import query_stats
+
+        app.config.setdefault('FLASKY_SLOW_QUERY_THRESHOLD', 0.1)
+        app.config.setdefault('FLASKY_SLOW_QUERY_LOG', None)
+        app.config.setdefault('FLASKY_SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024)
+        app.config.setdefault('FLASKY_SLOW_QUERY_LOG_BACKUPS', 5)
+        if self.on_query not in query_stats.listeners:
+            query_stats.listeners.append(self.on_query)
+
+    @staticmethod
+    def log_path(app) -> str:
+        return app.config['FLASKY_SLOW_QUERY_LOG'] or os.path.join(app.instance_path, 'slow_queries.jsonl')
+
+    def logger(self, app) -> logging.Logger:
+        """ The file is opened on the first slow statement, so apps that never log don't create it """
+        path = self.log_path(app)
+        with self._lock:
+            logger = self._loggers.get(path)
+            if logger is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handler = RotatingFileHandler(path, maxBytes=app.config['FLASKY_SLOW_QUERY_LOG_BYTES'],
+                                              backupCount=app.config['FLASKY_SLOW_QUERY_LOG_BACKUPS'])
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger = self._loggers[path] = logging.getLogger(f'flasky.slow_queries.{path}')
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                logger.addHandler(handler)
+            return logger
+
+    def close(self):
+        """ Closes the log files, the next slow statement reopens them """
+        with self._lock:
+            for logger in self._loggers.values():
+                for handler in list(logger.handlers):
+                    logger.removeHandler(handler)
+                    handler.close()
+            self._loggers.clear()
+
+    def on_query(self, cursor, statement, parameters, duration, executemany):
+        if not has_app_context():
+            return
+        app = current_app._get_current_object()
+        threshold = app.config['FLASKY_SLOW_QUERY_THRESHOLD']
+        if threshold is None or duration < threshold:
+            return
+
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            'statement': statement,
+            'parameters': parameter_shapes(parameters, executemany),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'call_site': call_site(),
+            'plan': explain(cursor, statement, parameters, executemany),
+        }
+        self.logger(app).info(json.dumps(entry))
+
+def parameter_shapes(parameters, executemany: bool):
+    """ Type names of the bound parameters, and the number of rows of an executemany """
+    if executemany:
+        rows = list(parameters)
+        return {'rows': len(rows), 'row': parameter_shapes(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+def call_site(limit: int = 3) -> list:
+    """ The innermost ``limit`` frames of application code on the current stack, e.g.
+    ``app/models.py:120 find_by_email``, skipping the instrumentation itself """
+    skipped = {os.path.join(APP_DIR, 'slowlog.py'), os.path.join(APP_DIR, 'querystats.py')}
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < limit:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR + os.sep) and filename not in skipped:
+            path = os.path.relpath(filename, os.path.dirname(APP_DIR)).replace(os.sep, '/')
+            frames.append(f'{path}:{frame.f_lineno} {frame.f_code.co_name}')
+        frame = frame.f_back
+    return frames
+
+def explain(cursor, statement: str, parameters, executemany: bool):
+    """ ``EXPLAIN QUERY PLAN`` of the statement on the connection that ran it, None off SQLite """
+    connection = getattr(cursor, 'connection', None)
+    if connection is None or type(connection).__module__ != 'sqlite3' or \
+            not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+        return None
+    if executemany:
+        parameters = next(iter(parameters), ())
+
+    try:
+        return [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+
+def statement_shape(statement: str) -> str:
+    """ Statement with whitespace collapsed and expanded IN lists folded into one placeholder """
+    return re.sub(r'\(\?(?:, \?)+\)', '(?...)', ' '.join(statement.split()))
+
+def read_entries(path: str):
+    """ Entries of the log and of its rotated backups, oldest file first """
+    backups = sorted((name for name in os.listdir(os.path.dirname(path) or '.')
+                      if re.fullmatch(re.escape(os.path.basename(path)) + r'\.\d+', name)),
+                     key=lambda name: -int(name.rsplit('.', 1)[1]))
+    for name in backups + [os.path.basename(path)]:
+        file = os.path.join(os.path.dirname(path), name)
+        if not os.path.exists(file):
+            continue
+        with open(file) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def summarize(entries) -> list:
+    """ Aggregates log entries by statement shape, slowest in total first
+
+    Returns:
+        list: one dict per shape with count, total/avg/max milliseconds, the most frequent
+        call sites and endpoints, and the plan steps that scan a table of ``WATCHED_TABLES``
+    """
+    groups = {}
+    for entry in entries:
+        shape = statement_shape(entry['statement'])
+        group = groups.setdefault(shape, {'statement': shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                          'call_sites': Counter(), 'endpoints': Counter(), 'scans': set()})
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['call_sites'][(entry['call_site'] or ['?'])[0]] += 1
+        group['endpoints'][entry['endpoint'] or '-'] += 1
+        for step in entry.get('plan') or ():
+            if re.match(r'SCAN (%s)\b' % '|'.join(WATCHED_TABLES), step):
+                group['scans'].add(step)
+
+    summary = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+    for group in summary:
+        group['avg_ms'] = group['total_ms'] / group['count']
+        group['call_sites'] = group['call_sites'].most_common(3)
+        group['endpoints'] = group['endpoints'].most_common(3)
+        group['scans'] = sorted(group['scans'])
+    return summary
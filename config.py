@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 baseDir = os.path.abspath(os.path.dirname(__file__))
 
@@ -13,6 +14,57 @@ class Config:
     FLASKY_MAIL_SUBJECT_PREFIX = '[Flasky]'
     FLASKY_MAIL_SENDER = 'Flasky Admin 4d27b946a6-f0691a@inbox.mailtrap.io'
     FLASKY_ADMIN = os.environ.get('FLASKY_ADMIN')
+    FLASKY_PING_FLUSH_INTERVAL = 30 # Seconds between bulk writes of buffered last_seen updates
+    FLASKY_PING_FLUSH_SIZE = 500 # Number of distinct users that forces an early flush
+    FLASKY_USER_CACHE_SIZE = 1024 # Users kept per worker by the login user_loader, 0 disables the cache
+    FLASKY_USER_CACHE_TTL = 60 # Seconds before a cached user is reloaded from the database
+    FLASKY_PROFILE_CACHE_BYTES = 4 * 1024 * 1024 # Memory budget for rendered profile pages per worker, 0 disables the cache
+    FLASKY_PROFILE_CACHE_TTL = 60 # Seconds before a rendered profile is rendered again
+    FLASKY_ROLE_TABLE_TTL = 30 # Seconds before the cached roles are reloaded, so other workers' role edits show up
+    FLASKY_COUNT_CACHE_SIZE = 256 # Filtered row counts kept per worker, 0 disables the cache
+    FLASKY_COUNT_CACHE_TTL = 60 # Seconds before a cached count is recounted
+    FLASKY_USERS_PER_PAGE = 50 # Users per page of the admin user directory
+    FLASKY_MAIL_WORKERS = 2 # Threads sending email, each keeps its own SMTP connection open
+    FLASKY_MAIL_QUEUE_SIZE = 1000 # Emails waiting to be sent before send_email applies backpressure
+    FLASKY_MAIL_BATCH_SIZE = 20 # Emails a worker sends per wake-up
+    FLASKY_MAIL_ENQUEUE_TIMEOUT = 5 # Seconds send_email waits on a full queue before raising MailQueueFull
+    FLASKY_MAIL_IDLE_TIMEOUT = 30 # Seconds without mail after which a worker closes its SMTP connection
+    FLASKY_MAIL_OUTBOX = os.environ.get('FLASKY_MAIL_OUTBOX', '').lower() in ('1', 'true') # Queue email in the outbox table for `flask mail-worker`
+    FLASKY_OUTBOX_BACKOFF = 30 # Seconds before the first retry of a failed email, doubled on every attempt
+    FLASKY_OUTBOX_MAX_BACKOFF = 3600 # Upper bound for the retry delay
+    FLASKY_OUTBOX_MAX_ATTEMPTS = 8 # Attempts before an email is marked as failed
+    FLASKY_OUTBOX_LEASE = 300 # Seconds after which a claim by a crashed mail worker expires
+    FLASKY_ADMIN_DIGEST_WINDOW = 300 # Seconds of "New User" notifications collected into one email, 0 sends each one immediately
+    FLASKY_PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000' # Werkzeug hash method, older hashes are upgraded on login
+    FLASKY_PASSWORD_HASH_POOL_SIZE = 0 # Processes hashing passwords, 0 hashes on the request thread
+    FLASKY_LOCAL_AVATARS = os.environ.get('FLASKY_LOCAL_AVATARS', '').lower() in ('1', 'true') # Serve identicons from /avatar instead of Gravatar
+    FLASKY_AVATAR_CACHE_DIR = os.environ.get('FLASKY_AVATAR_CACHE_DIR') # Rendered identicons, defaults to <instance>/avatars
+    FLASKY_COMPRESS = os.environ.get('FLASKY_COMPRESS', '').lower() in ('1', 'true') # Compress text responses and answer If-None-Match
+    FLASKY_COMPRESS_LEVEL = 6 # gzip/deflate compression level
+    FLASKY_COMPRESS_MIN_SIZE = 500 # Bodies smaller than this many bytes are sent uncompressed
+    FLASKY_COMPRESS_CACHE_BYTES = 8 * 1024 * 1024 # Memory budget for compressed bodies per worker
+    FLASKY_ASSET_FINGERPRINTS = True # Emit content-hashed static URLs served with immutable caching
+    FLASKY_ASSET_MANIFEST = os.environ.get('FLASKY_ASSET_MANIFEST') # Written by `flask assets`, defaults to app/static/manifest.json
+    FLASKY_ASSET_GZIP = False # Serve the .gz copies written by `flask assets --gzip`
+    FLASKY_EXISTENCE_FILTER = True # Answer username/email existence checks from in-memory Bloom filters
+    FLASKY_EXISTENCE_ERROR_RATE = 0.01 # Bloom filter false positive rate, positives fall back to a query
+    FLASKY_EXISTENCE_SYNC_INTERVAL = 5 # Seconds between catching up on users inserted or renamed by other workers
+    FLASKY_EXISTENCE_REBUILD_INTERVAL = 3600 # Seconds between full rebuilds, which resize the filters and drop old names
+    FLASKY_SQLITE_PRAGMAS = {} # PRAGMA name/value pairs run on every new SQLite connection
+    FLASKY_QUERY_STATS = True # Count and time SQL statements per request, reported in a Server-Timing header
+    FLASKY_QUERY_PANEL = False # Append a panel listing the request's SQL statements to HTML pages
+    FLASKY_QUERY_N_PLUS_ONE = 5 # Executions of one statement shape per request that are logged as a probable N+1
+    FLASKY_SLOW_QUERY_THRESHOLD = 0.1 # Seconds, slower statements are written to the slow query log, None disables it
+    FLASKY_SLOW_QUERY_LOG = os.environ.get('FLASKY_SLOW_QUERY_LOG') # JSONL file read by `flask slow-queries`, defaults to <instance>/slow_queries.jsonl
+    FLASKY_SLOW_QUERY_LOG_BYTES = 10 * 1024 * 1024 # Size at which the log is rotated
+    FLASKY_SLOW_QUERY_LOG_BACKUPS = 5 # Rotated files kept
+    FLASKY_PROFILE_DIR = os.environ.get('FLASKY_PROFILE_DIR') # Request profiles, defaults to <instance>/profiles
+    FLASKY_PROFILE_KEEP = 50 # Profiles kept, older ones are deleted
+    FLASKY_PROFILE_SAMPLE_INTERVAL = 0.001 # Seconds between stack samples of the sampling profiler
+    FLASKY_METRICS = True # Serve request, database pool and email metrics at /metrics
+    FLASKY_METRICS_DIR = os.environ.get('FLASKY_METRICS_DIR') # Shared by the workers of a pre-fork server, unset reports this process only
+    FLASKY_METRICS_FLUSH_INTERVAL = 5 # Seconds between writes of a worker's metrics to FLASKY_METRICS_DIR
+    FLASKY_REPLICA_MAX_LAG = 10 # Seconds the replica may trail the primary, users who wrote more recently read from the primary
 
     @staticmethod
     def init_app(app):
@@ -20,21 +72,60 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEGUG = True
+    FLASKY_QUERY_PANEL = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + os.path.join(baseDir, 'data-dev.sqlite')
+    SQLALCHEMY_BINDS = {'replica': os.environ['DEV_REPLICA_DATABASE_URL']} \
+        if os.environ.get('DEV_REPLICA_DATABASE_URL') else {} # Read replica for views marked @read_only
 
 class TestingConfig(Config):
     TESTING = True
+    FLASKY_ADMIN_DIGEST_WINDOW = 0
+    FLASKY_PING_FLUSH_INTERVAL = 0
+    FLASKY_PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
 
 class ProductionConfig(Config):
+    FLASKY_MAIL_OUTBOX = os.environ.get('FLASKY_MAIL_OUTBOX', 'true').lower() in ('1', 'true')
+    FLASKY_PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+    FLASKY_COMPRESS = os.environ.get('FLASKY_COMPRESS', 'true').lower() in ('1', 'true')
+    FLASKY_ASSET_GZIP = True
+    FLASKY_PASSWORD_HASH_POOL_SIZE = int(os.environ.get('FLASKY_PASSWORD_HASH_POOL_SIZE') or 2)
+    FLASKY_SQLITE_PRAGMAS = {
+        'busy_timeout': 5000, # Milliseconds a writer waits for the lock before raising "database is locked"
+        'journal_mode': 'WAL', # Readers see the last commit instead of waiting for writers
+        'synchronous': 'NORMAL', # With WAL, fsync at checkpoints only; a crash can't corrupt the database
+        'mmap_size': 256 * 1024 * 1024, # Read pages through a memory map instead of read() calls
+        'cache_size': -64 * 1024, # Page cache per connection, negative values are KiB
+        'temp_store': 'MEMORY', # Sorts and temporary indexes never touch the disk
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE') or 8), # Connections kept open, one per worker thread
+        'max_overflow': 4, # Extra connections opened under bursts and closed afterwards
+        'pool_timeout': 10, # Seconds a request waits for a free connection
+    }
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(baseDir, 'data.data.sqlite')
+    SQLALCHEMY_BINDS = {'replica': os.environ['REPLICA_DATABASE_URL']} \
+        if os.environ.get('REPLICA_DATABASE_URL') else {} # Read replica for views marked @read_only
+
+class BenchmarkConfig(ProductionConfig):
+    """ Production settings on a scratch database, for `flask bench` """
+    TESTING = True # Keeps Flask-Mail from sending
+    WTF_CSRF_ENABLED = False # Clients post forms without fetching them first
+    FLASKY_ADMIN = None
+    FLASKY_SLOW_QUERY_THRESHOLD = None # EXPLAIN on every slow statement would skew the numbers
+    FLASKY_PASSWORD_HASH_METHOD = os.environ.get('FLASKY_BENCH_HASH_METHOD') or \
+        ProductionConfig.FLASKY_PASSWORD_HASH_METHOD # A cheap method benchmarks everything but the hashing
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(tempfile.gettempdir(), 'flasky-bench.sqlite') # Dropped and seeded by each run
+    SQLALCHEMY_BINDS = {}
 
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
     'production': ProductionConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
@@ -1,15 +1,16 @@
 import os
 import click
 from flask_migrate import Migrate
-from app import create_app, db
+from app import create_app, db, user_cache
 from app.models import Role, User, Permission
+from app.bench import SCENARIOS
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
 migrate = Migrate(app, db)
 
 @app.shell_context_processor
 def make_shell_context():
-    return dict(db=db, User=User, Role=Role, Permission=Permission)
+    return dict(db=db, User=User, Role=Role, Permission=Permission, user_cache=user_cache)
 
 @app.cli.command()
 @click.argument('test_names', nargs=-1)
@@ -23,3 +24,146 @@ def test(test_names):
         tests = unittest.TestLoader().discover('tests')
 
     unittest.TextTestRunner(verbosity=2).run(tests)
+
+@app.cli.command('mail-worker')
+@click.option('--batch-size', default=50, help='Emails claimed and sent per batch.')
+@click.option('--poll-interval', default=5.0, help='Seconds to wait when the outbox has nothing due.')
+@click.option('--once', is_flag=True, help='Exit once the outbox has nothing due instead of polling.')
+def mail_worker(batch_size, poll_interval, once):
+    """Deliver the emails queued in the outbox."""
+    from app.outbox import run_worker
+    run_worker(batch_size, poll_interval, once, log=click.echo)
+
+@app.cli.command()
+@click.option('--gzip', 'precompress', is_flag=True, help='Also write a .gz copy of every text asset.')
+def assets(precompress):
+    """Build the fingerprinted static asset manifest."""
+    from app import assets as asset_manifest
+    manifest = asset_manifest.build(app, precompress)
+    for name, fingerprinted in sorted(manifest.items()):
+        click.echo(f'{name} -> {fingerprinted}')
+
+@app.cli.command('replica-sync')
+@click.option('--interval', default=0.0, help='Seconds between copies, 0 copies once and exits.')
+def replica_sync(interval):
+    """Copy the primary SQLite database into the read replica."""
+    import time
+    from app import read_replica
+
+    if not read_replica.enabled():
+        raise click.UsageError('No "replica" bind in SQLALCHEMY_BINDS.')
+
+    while True:
+        click.echo(f'Replica synced in {read_replica.sync():.3f}s')
+        if interval <= 0:
+            break
+        time.sleep(interval)
+
+@app.cli.command('slow-queries')
+@click.option('--log', 'path', default=None, help='Log to read, defaults to the configured slow query log.')
+@click.option('--limit', default=20, help='Statements to show, slowest in total first.')
+def slow_queries(path, limit):
+    """Summarize the slow query log."""
+    from app import slow_query_log
+    from app.slowlog import read_entries, summarize, WATCHED_TABLES
+
+    path = path or slow_query_log.log_path(app)
+    summary = summarize(read_entries(path))
+    if not summary:
+        click.echo(f'No slow queries in {path}')
+        return
+
+    for group in summary[:limit]:
+        click.echo(f"{group['count']}x  total {group['total_ms']:.1f} ms  avg {group['avg_ms']:.1f} ms  "
+                   f"max {group['max_ms']:.1f} ms")
+        click.echo(f"  {group['statement']}")
+        click.echo('  called from ' + ', '.join(f'{site} ({n})' for site, n in group['call_sites']))
+        click.echo('  endpoints ' + ', '.join(f'{endpoint} ({n})' for endpoint, n in group['endpoints']))
+        for step in group['scans']:
+            click.secho(f'  FULL SCAN: {step}', fg='red')
+
+    flagged = sum(1 for group in summary if group['scans'])
+    if flagged:
+        click.secho(f"{flagged} statement(s) scan {'/'.join(WATCHED_TABLES)}", fg='red')
+
+@app.cli.command()
+@click.option('--users', default=1000, help='Users seeded before the run.')
+@click.option('--clients', default=4, help='Concurrent clients.')
+@click.option('--requests', default=200, help='Requests per endpoint.')
+@click.option('--endpoint', 'endpoints', multiple=True, type=click.Choice(list(SCENARIOS)),
+              help='Endpoint to run, repeatable, defaults to all.')
+@click.option('--output', default=None, help='Write the results to this JSON file.')
+@click.option('--baseline', default=None, help='JSON results to compare against, exits with 1 on regressions.')
+@click.option('--tolerance', default=0.2, help='Allowed slowdown against the baseline, as a fraction.')
+def bench(users, clients, requests, endpoints, output, baseline, tolerance):
+    """Benchmark the main endpoints with concurrent in-process clients.
+
+    Runs on the scratch database of the "benchmark" configuration, BENCH_DATABASE_URL,
+    which is recreated first."""
+    from app import bench as benchmark
+
+    bench_app = create_app('benchmark')
+    results = benchmark.run(bench_app, users, clients, requests, endpoints or None, log=click.echo)
+    if output:
+        benchmark.save(results, output)
+
+    if baseline:
+        regressions = benchmark.compare(results, benchmark.load(baseline), tolerance)
+        for regression in regressions:
+            click.secho(f'REGRESSION {regression}', fg='red')
+        if regressions:
+            raise SystemExit(1)
+        click.echo(f'No regressions against {baseline}')
+
+@app.cli.command('seed-users')
+@click.option('--count', default=10000, help='Users to generate.')
+@click.option('--batch-size', default=10000, help='Rows per INSERT.')
+@click.option('--password', default='password', help='Password shared by every generated user.')
+@click.option('--confirmed', default=0.9, help='Share of confirmed users.')
+@click.option('--prefix', default='user', help='Usernames are <prefix><n>, emails <prefix><n>@example.com.')
+@click.option('--seed', default=None, type=int, help='Random seed, for reproducible data.')
+def seed_users(count, batch_size, password, confirmed, prefix, seed):
+    """Generate synthetic users with bulk inserts, for testing at scale."""
+    from app.seed import seed_users as generate
+
+    stats = generate(count, password=password, confirmed=confirmed, prefix=prefix, batch_size=batch_size,
+                     seed=seed, log=click.echo)
+    click.echo(f"Inserted {stats['rows']} users in {stats['seconds']:.1f}s, {stats['rows_per_second']:.0f} rows/s")
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Input format, by default taken from the file extension.')
+@click.option('--batch-size', default=1000, help='Records hashed, inserted and committed together.')
+@click.option('--workers', default=None, type=int, help='Processes hashing passwords, by default the configured pool.')
+@click.option('--confirmed', is_flag=True, help='Mark the imported accounts as confirmed.')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint of an earlier run and start over.')
+def import_users(path, file_format, batch_size, workers, confirmed, restart):
+    """Import user accounts from a CSV or JSON Lines file.
+
+    Rejected records are written to PATH.rejects.jsonl. An interrupted import resumes from
+    PATH.checkpoint when run again."""
+    from app.importer import import_users as run_import, rejects_path
+
+    stats = run_import(path, file_format, batch_size, workers, confirmed, restart, log=click.echo)
+    if stats['skipped']:
+        click.echo(f"Resumed after record {stats['skipped']}")
+    click.echo(f"Imported {stats['imported']} users in {stats['seconds']:.1f}s, {stats['rows_per_second']:.0f} rows/s")
+    if stats['rejected']:
+        click.secho(f"Rejected {stats['rejected']} records, see {rejects_path(path)}", fg='red')
+
+@app.cli.command('export-users')
+@click.option('--format', 'file_format', type=click.Choice(['ndjson', 'csv']), default='ndjson', help='Output format.')
+@click.option('--columns', default='', help='Comma separated columns, all when empty.')
+@click.option('--output', type=click.File('w'), default='-', help='Output file, standard output by default.')
+@click.option('--page-size', default=1000, help='Users read per query.')
+def export_users(file_format, columns, output, page_size):
+    """Export all users as NDJSON or CSV."""
+    from app.export import parse_columns, export_users as generate
+
+    try:
+        columns = parse_columns(columns)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--columns')
+    for chunk in generate(columns, file_format, page_size):
+        output.write(chunk)
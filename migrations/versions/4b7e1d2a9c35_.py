@@ -0,0 +1,50 @@
+"""normalize users.email
+
+Revision ID: 4b7e1d2a9c35
+Revises: 9d4e2b7c6f10
+Create Date: 2026-10-18 14:21:09.503318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e1d2a9c35'
+down_revision = '9d4e2b7c6f10'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    # Emails are stored stripped and lowercased from now on, so lookups can stay equality
+    # matches on ix_users_email. Rows that only differ in case would collide on the unique
+    # index, those have to be merged by hand before upgrading.
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column('email', sa.String))
+    normalized = sa.func.lower(sa.func.trim(users.c.email))
+    connection = op.get_bind()
+
+    duplicates = connection.execute(
+        sa.select(normalized)
+        .where(users.c.email.isnot(None))
+        .group_by(normalized)
+        .having(sa.func.count() > 1)).scalars().all()
+    if duplicates:
+        raise RuntimeError('Emails registered more than once in different case: ' +
+                           ', '.join(sorted(duplicates)))
+
+    # Only rows that change are rewritten, one primary key range per UPDATE
+    max_id = connection.execute(sa.select(sa.func.max(users.c.id))).scalar() or 0
+    for start in range(0, max_id, BATCH_SIZE):
+        connection.execute(
+            users.update()
+            .where(users.c.id > start, users.c.id <= start + BATCH_SIZE,
+                   users.c.email != normalized)
+            .values(email=normalized))
+
+
+def downgrade():
+    # The original spelling of each email is not kept, normalized emails remain valid
+    pass
@@ -1,6 +1,12 @@
+import gzip
+import json
+import os
+import tempfile
+import time
 import unittest
-from flask import current_app
+from flask import current_app, url_for
 from app import create_app, db
+from config import config, TestingConfig
 
 class BasicsTestCase(unittest.TestCase):
     def setUp(self):
@@ -19,3 +25,59 @@ class BasicsTestCase(unittest.TestCase):
 
     def test_app_is_testing(self):
         self.assertTrue(current_app.config['TESTING'])
+
+    def test_static_fingerprints(self):
+        """ Test to validate that static URLs are fingerprinted and served as immutable """
+        with current_app.test_request_context():
+            url = url_for('static', filename='styles.css')
+        self.assertRegex(url, r'^/static/styles\.[0-9a-f]{8}\.css$')
+
+        response = current_app.test_client().get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        response.close()
+
+    def test_stale_manifest_rebuilt(self):
+        """ Test to validate that a manifest older than the static files is rebuilt at start """
+        fd, manifest_path = tempfile.mkstemp(suffix='.json')
+        self.addCleanup(os.remove, manifest_path)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'favicon.ico': 'favicon.00000000.ico', 'styles.css': 'styles.00000000.css'}, f)
+        config['manifest'] = type('ManifestConfig', (TestingConfig,), {'FLASKY_ASSET_MANIFEST': manifest_path})
+        self.addCleanup(config.pop, 'manifest')
+
+        # Written after the static files, the manifest is trusted
+        os.utime(manifest_path, (time.time() + 60, time.time() + 60))
+        app = create_app('manifest')
+        self.assertEqual(app.extensions['asset_manifest']['files']['styles.css'], 'styles.00000000.css')
+
+        os.utime(manifest_path, (0, 0))
+        app = create_app('manifest')
+        self.assertRegex(app.extensions['asset_manifest']['files']['styles.css'], r'^styles\.[0-9a-f]{8}\.css$')
+        self.assertNotEqual(app.extensions['asset_manifest']['files']['styles.css'], 'styles.00000000.css')
+
+    def test_stale_gzip_not_served(self):
+        """ Test to validate that a precompressed copy older than its source is not served """
+        current_app.config['FLASKY_ASSET_GZIP'] = True
+        source = os.path.join(current_app.static_folder, 'styles.css')
+        with open(source, 'rb') as f:
+            content = f.read()
+        with open(source + '.gz', 'wb') as f:
+            f.write(gzip.compress(b'stale'))
+        self.addCleanup(os.remove, source + '.gz')
+        with current_app.test_request_context():
+            url = url_for('static', filename='styles.css')
+        client = current_app.test_client()
+
+        modified = os.path.getmtime(source)
+        os.utime(source + '.gz', (modified - 60, modified - 60))
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, content)
+        response.close()
+
+        os.utime(source + '.gz', (modified + 60, modified + 60))
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        response.close()
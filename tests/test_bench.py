@@ -0,0 +1,58 @@
+""" Load Benchmark Tests """
+
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, bench, user_cache
+from config import config, TestingConfig
+
+class BenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # A file database, so that the client threads share it
+        config['bench'] = type('BenchConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmp_dir, 'bench.sqlite'),
+            'WTF_CSRF_ENABLED': False,
+            'FLASKY_ADMIN': None,
+        })
+        self.app = create_app('bench')
+
+    def tearDown(self):
+        config.pop('bench')
+        with self.app.app_context():
+            user_cache.clear()
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_run(self):
+        """ Test to validate that every endpoint is benchmarked without errors """
+        results = bench.run(self.app, users=20, clients=2, requests=6, log=lambda message: None)
+        self.assertEqual(set(results['endpoints']), set(bench.SCENARIOS))
+        for endpoint, result in results['endpoints'].items():
+            self.assertEqual(result['requests'], 6, endpoint)
+            self.assertEqual(result['errors'], 0, endpoint)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        self.assertGreater(results['endpoints']['main.user']['queries_per_request'], 0)
+        self.assertGreater(results['meta']['peak_rss_kb'], 0)
+        self.assertNotIn('peak_rss_kb', results['endpoints']['main.user'])
+
+        path = os.path.join(self.tmp_dir, 'results.json')
+        bench.save(results, path)
+        self.assertEqual(bench.compare(bench.load(path), results, 0.2), [])
+
+    def test_compare(self):
+        """ Test to validate that slower, leaner or failing endpoints are reported """
+        def results(p95, rps, queries, errors):
+            return {'endpoints': {'main.user': {'p50_ms': 5, 'p95_ms': p95, 'p99_ms': 20,
+                                                'requests_per_second': rps, 'queries_per_request': queries,
+                                                'errors': errors}}}
+
+        baseline = results(10, 100, 2, 0)
+        self.assertEqual(bench.compare(results(11.9, 81, 2, 0), baseline, 0.2), [])
+        regressions = bench.compare(results(12.5, 70, 3, 1), baseline, 0.2)
+        self.assertEqual(len(regressions), 4)
+        self.assertTrue(all(regression.startswith('main.user: ') for regression in regressions))
+        self.assertEqual(bench.compare({'endpoints': {'main.index': {}}}, baseline, 0.2), [])
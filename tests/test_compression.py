@@ -0,0 +1,97 @@
+""" Response Compression Tests """
+
+import gzip
+import time
+import unittest
+from flask import template_rendered
+from app import create_app, db
+from app.models import User, Role
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_COMPRESS'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='john@example.com', username='john', password='cat'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_gzip_and_conditional_get(self):
+        """ Test to validate that pages are gzipped for clients that accept it and revalidated with 304 """
+        client = self.app.test_client()
+        response = client.get('/auth/login', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertIn(b'Log In', gzip.decompress(response.data))
+
+        response = client.get('/user/john', headers={'Accept-Encoding': 'gzip'})
+        etag = response.headers['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        response = client.get('/user/john', headers={'Accept-Encoding': 'gzip',
+                                                     'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        response = client.get('/user/john')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_view_answers_not_modified(self):
+        """ Test to validate that the profile view answers a gzip revalidation itself, without rendering """
+        client = self.app.test_client()
+        etag = client.get('/user/john', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+
+        rendered = []
+        def record(sender, template, context, **extra):
+            rendered.append(template.name)
+        template_rendered.connect(record, self.app)
+        try:
+            response = client.get('/user/john', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        finally:
+            template_rendered.disconnect(record, self.app)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(rendered, [])
+
+        response = client.get('/user/john', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_keyed_on_body(self):
+        """ Test to validate that bodies sharing a view's ETag are never answered with each other """
+        bodies = iter(['first ' * 100, 'second ' * 100])
+
+        @self.app.route('/fixed-etag')
+        def fixed_etag():
+            response = self.app.response_class(next(bodies), mimetype='text/plain')
+            response.set_etag('fixed')
+            return response
+
+        client = self.app.test_client()
+        for expected in (b'first', b'second'):
+            response = client.get('/fixed-etag', headers={'Accept-Encoding': 'gzip'})
+            self.assertTrue(gzip.decompress(response.data).startswith(expected))
+
+    def test_bytes_on_wire_benchmark(self):
+        """ Benchmark reporting bytes on the wire and latency with and without compression """
+        urls = ['/', '/user/john', '/auth/login', '/auth/register']
+        results = []
+
+        client = self.app.test_client()
+
+        for url in urls:
+            for compress in (False, True):
+                self.app.config['FLASKY_COMPRESS'] = compress
+                started = time.perf_counter()
+                for _ in range(20):
+                    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+                latency = (time.perf_counter() - started) / 20 * 1000
+                results.append(f'{url} {"gzip" if compress else "identity"}: '
+                               f'{len(response.data)} bytes, {latency:.2f} ms')
+
+        print('\n' + '\n'.join(results))
@@ -0,0 +1,131 @@
+""" Admin User Directory Tests """
+
+import re
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import create_app, db, directory, user_cache
+from app.models import User, Role
+
+class UserDirectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['FLASKY_USERS_PER_PAGE'] = 4
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        admin_role = Role.query.filter_by(name='Administrator').first()
+        self.now = datetime(2026, 10, 1)
+        db.session.add(User(email='admin@example.com', username='admin', password='cat', confirmed=True,
+                            role=admin_role, member_since=self.now, last_seen=self.now))
+        # Two users a day, on the same second, so pages have to break ties on id
+        db.session.add_all([User(email=f'user{i}@example.com', username=f'user{i}', password='dog',
+                                 confirmed=i % 3 != 0, member_since=self.now - timedelta(days=1 + i // 2),
+                                 last_seen=self.now - timedelta(hours=1 + i))
+                            for i in range(10)])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def walk(self, filters, sort='member_since', per_page=3):
+        """ Usernames of every page going forward, then of every page going back """
+        pages, page = [], directory.page(filters, sort, per_page=per_page)
+        pages.append([user.username for user in page.users])
+        while page.next_cursor:
+            page = directory.page(filters, sort, after=page.next_cursor, per_page=per_page)
+            pages.append([user.username for user in page.users])
+        back = [[user.username for user in page.users]]
+        while page.prev_cursor:
+            page = directory.page(filters, sort, before=page.prev_cursor, per_page=per_page)
+            back.insert(0, [user.username for user in page.users])
+        return pages, back
+
+    def test_seek_pagination(self):
+        """ Test to validate that paging forward and back visits every user once, newest first """
+        pages, back = self.walk(directory.Filters())
+        expected = ['admin'] + [f'user{i}' for i in (1, 0, 3, 2, 5, 4, 7, 6, 9, 8)] # Ties newest id first
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual(back, pages)
+
+        pages, _ = self.walk(directory.Filters(), sort='last_seen')
+        self.assertEqual(sum(pages, []), ['admin'] + [f'user{i}' for i in range(10)])
+
+    def test_filters(self):
+        """ Test to validate the role, confirmation and date range filters and the count """
+        user_role = Role.query.filter_by(name='User').first()
+        filters = directory.Filters(role_id=user_role.id, confirmed=False)
+        self.assertEqual(sorted(sum(self.walk(filters)[0], [])), ['user0', 'user3', 'user6', 'user9'])
+        self.assertEqual(directory.count(filters), 4)
+
+        day = (self.now - timedelta(days=2)).date()
+        filters = directory.Filters(member_since_from=day, member_since_to=day)
+        self.assertEqual(sorted(sum(self.walk(filters)[0], [])), ['user2', 'user3'])
+        filters = directory.Filters(last_seen_from=self.now.date())
+        self.assertEqual(directory.count(filters), 1)
+
+        # Counts are served from the cache until it expires
+        db.session.add(User(email='late@example.com', username='late', password='dog'))
+        db.session.commit()
+        self.assertEqual(directory.count(directory.Filters()), 12)
+        self.assertEqual(directory.count(directory.Filters()), 12)
+        User.query.filter_by(username='late').delete()
+        db.session.commit()
+        self.assertEqual(directory.count(directory.Filters()), 12)
+
+    def test_pages_use_indexes(self):
+        """ Test to validate that every sort, with or without a role filter, reads pages off an index """
+        statements = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if re.search(r'\bFROM users\b', statement) and 'LIMIT' in statement:
+                statements.append((statement, parameters))
+
+        user_role = Role.query.filter_by(name='User').first()
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            for sort in directory.SORTS:
+                for filters in (directory.Filters(), directory.Filters(role_id=user_role.id)):
+                    page = directory.page(filters, sort, per_page=3)
+                    page = directory.page(filters, sort, after=page.next_cursor, per_page=3)
+                    directory.page(filters, sort, before=page.prev_cursor, per_page=3)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        self.assertEqual(len(statements), len(directory.SORTS) * 2 * 3)
+        connection = db.engine.raw_connection()
+        try:
+            for statement, parameters in statements:
+                plan = [row[3] for row in connection.cursor().execute(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()]
+                self.assertFalse([step for step in plan if 'TEMP B-TREE' in step], f'{statement}\n{plan}')
+                self.assertTrue(all(step.startswith('SEARCH') for step in plan), f'{statement}\n{plan}')
+        finally:
+            connection.close()
+
+    def test_directory_page(self):
+        """ Test to validate the directory view, its pager links and its access control """
+        self.client.post('/auth/login', data={'email': 'admin@example.com', 'password': 'cat'})
+        response = self.client.get('/admin/users?confirmed=no&sort=member_since')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('4 matching', html)
+        self.assertEqual(re.findall(r'>(user\d)</a>', html), ['user0', 'user3', 'user6', 'user9'])
+        self.assertNotIn('after=', html)
+
+        html = self.client.get('/admin/users').get_data(as_text=True)
+        older = re.search(r'href="([^"]*after=[^"]*)"', html).group(1).replace('&amp;', '&')
+        html = self.client.get(older).get_data(as_text=True)
+        self.assertEqual(re.findall(r'>(user\d)</a>', html), ['user2', 'user5', 'user4', 'user7'])
+        self.assertIn('before=', html)
+
+        self.assertEqual(self.client.get('/admin/users?after=garbage').status_code, 400)
+        self.client.get('/auth/logout')
+        self.client.post('/auth/login', data={'email': 'user1@example.com', 'password': 'dog'})
+        self.assertEqual(self.client.get('/admin/users').status_code, 403)
@@ -0,0 +1,110 @@
+""" Email Worker Pool Tests """
+
+import socketserver
+import threading
+import time
+import unittest
+from flask_mail import Message
+from app import create_app, mail
+from app.email import mail_pool
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """ Minimal local SMTP server that accepts every message, except to recipients named ``reject@``,
+    and counts connections and messages """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super(SMTPStandIn, self).__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        self.reply(b'220 localhost ESMTP stand-in')
+        in_data = False
+
+        for line in self.rfile:
+            if in_data:
+                if line == b'.\r\n':
+                    in_data = False
+                    with self.server.lock:
+                        self.server.messages += 1
+                    self.reply(b'250 OK')
+                continue
+
+            command = line[:4].upper()
+            if command in (b'EHLO', b'HELO'):
+                self.reply(b'250 localhost')
+            elif command == b'DATA':
+                in_data = True
+                self.reply(b'354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'RCPT' and b'<reject@' in line:
+                self.reply(b'550 No such user')
+            elif command == b'QUIT':
+                self.reply(b'221 Bye')
+                return
+            else:
+                self.reply(b'250 OK')
+
+class EmailPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = SMTPStandIn()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.app = create_app('testing')
+        self.app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=self.server.server_address[1],
+                               MAIL_USE_TLS=False, MAIL_USERNAME=None, MAIL_PASSWORD=None,
+                               MAIL_SUPPRESS_SEND=False, FLASKY_MAIL_WORKERS=2)
+        mail.init_app(self.app)
+        mail_pool.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        mail_pool.state.shutdown()
+        self.app_context.pop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def message(self, i):
+        return Message(f'Test {i}', sender='flasky@example.com', recipients=['user@example.com'],
+                       body='Hello')
+
+    def test_workers_reuse_connections(self):
+        """ Test to validate that every queued email is delivered over at most one connection per worker """
+        for i in range(50):
+            mail_pool.submit(self.message(i))
+        mail_pool.join()
+
+        stats = mail_pool.stats()
+        self.assertEqual(self.server.messages, 50)
+        self.assertEqual(stats['sent'], 50)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertLessEqual(self.server.connections, 2)
+
+    def test_throughput_benchmark(self):
+        """ Benchmark comparing the pool against one connection per email, as send_email used to do """
+        count = 200
+
+        started = time.perf_counter()
+        for i in range(count):
+            mail.send(self.message(i))
+        per_message = count / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for i in range(count):
+            mail_pool.submit(self.message(i))
+        mail_pool.join()
+        pooled = count / (time.perf_counter() - started)
+
+        self.assertEqual(self.server.messages, 2 * count)
+        print(f'\nemail throughput: {per_message:.0f} msgs/s with a connection per email, '
+              f'{pooled:.0f} msgs/s through the pool')
@@ -0,0 +1,105 @@
+""" Username/Email Existence Index Tests """
+
+import unittest
+from datetime import datetime
+from app import create_app, db, existence_index, query_stats
+from app.existence import BloomFilter
+from app.models import User, Role
+
+class ExistenceIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='john@example.com', username='john', password='cat'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_bloom_filter(self):
+        """ Test to validate that the filter has no false negatives and few false positives """
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'user{i}')
+        self.assertTrue(all(f'user{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_lookups(self):
+        """ Test to validate taken checks, including users added after the filters were built """
+        self.assertTrue(existence_index.username_taken('john'))
+        self.assertTrue(existence_index.email_taken('john@example.com'))
+        self.assertFalse(existence_index.username_may_exist('susan'))
+
+        db.session.add(User(email='susan@example.com', username='susan', password='dog'))
+        db.session.commit()
+        self.assertTrue(existence_index.username_taken('susan'))
+
+        # Rows written behind the ORM's back, e.g. by another worker, show up after a sync
+        db.session.execute(User.__table__.insert().values(username='david', email='david@example.com'))
+        db.session.commit()
+        self.assertFalse(existence_index.username_may_exist('david'))
+        existence_index.state.sync()
+        self.assertTrue(existence_index.username_taken('david'))
+
+    def test_check_availability(self):
+        """ Test to validate the JSON availability endpoint """
+        response = self.app.test_client().get(
+            '/auth/check-availability?username=john&email=susan@example.com')
+        self.assertEqual(response.json, {
+            'username': {'value': 'john', 'available': False},
+            'email': {'value': 'susan@example.com', 'available': True}})
+
+    def test_renamed_on_another_worker(self):
+        """ Test to validate that names changed behind the index are found after a sync and never cause a 500 """
+        existence_index.state.rebuild()
+        user = User.query.filter_by(username='john').one()
+        user.username = 'jo'
+        db.session.commit()
+        self.assertIsNotNone(user.renamed_at)
+
+        # A rename by another worker, stamped like the ORM stamps it, is unknown here until the next sync
+        db.session.execute(User.__table__.update().where(User.username == 'jo')
+                           .values(username='johnny', email='johnny@example.com', renamed_at=datetime.utcnow()))
+        db.session.commit()
+        self.assertFalse(existence_index.username_may_exist('johnny'))
+
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        client = self.app.test_client()
+        self.assertEqual(client.get('/user/johnny').status_code, 404)
+        existence_index.state.sync()
+        self.assertTrue(existence_index.username_may_exist('johnny'))
+        self.assertEqual(client.get('/user/johnny').status_code, 200)
+
+        with query_stats.capture() as log:
+            self.assertEqual(client.get('/user/nobody').status_code, 404)
+        self.assertFalse([statement for statement in log.queries if 'FROM users' in statement[0]])
+
+        # Writes of a name taken before the next sync fail validation instead of with a 500
+        db.session.execute(User.__table__.update().where(User.username == 'johnny')
+                           .values(username='johnny3', email='johnny3@example.com', renamed_at=datetime.utcnow()))
+        db.session.commit()
+        response = client.post('/auth/register', data={'email': 'johnny3@example.com', 'username': 'johnny3',
+                                                       'password': 'dog', 'password2': 'dog'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Username already in use.', response.get_data(as_text=True))
+        self.assertIn('Email already registered.', response.get_data(as_text=True))
+        self.assertTrue(existence_index.username_may_exist('johnny3'))
+
+        admin_role = Role.query.filter_by(name='Administrator').first()
+        admin = User(email='admin@example.com', username='admin', password='cat', confirmed=True, role=admin_role)
+        db.session.add(admin)
+        db.session.commit()
+        existence_index.state.rebuild()
+        db.session.execute(User.__table__.update().where(User.username == 'johnny3').values(username='john2'))
+        db.session.commit()
+        client.post('/auth/login', data={'email': 'admin@example.com', 'password': 'cat'})
+        response = client.post(f'/edit-profile/{admin.id}', data={'email': 'admin@example.com', 'username': 'john2',
+                                                                  'role': admin_role.id, 'confirmed': 'y'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Username already in user.', response.get_data(as_text=True))
@@ -0,0 +1,88 @@
+""" User Export Tests """
+
+import csv
+import io
+import json
+import unittest
+from app import create_app, db, user_cache
+from app.export import iter_users, parse_columns
+from app.models import User, Role
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        admin_role = Role.query.filter_by(name='Administrator').first()
+        db.session.add(User(email='admin@example.com', username='admin', password='cat', confirmed=True,
+                            role=admin_role))
+        db.session.add_all([User(email=f'user{i}@example.com', username=f'user{i}', password='dog', confirmed=True)
+                            for i in range(4)])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, email, password):
+        self.client.post('/auth/login', data={'email': email, 'password': password})
+
+    def test_keyset_pages(self):
+        """ Test to validate that paging by id returns every user once, in order """
+        users = list(iter_users(['username', 'role', 'id'], page_size=2))
+        self.assertEqual([user['id'] for user in users], [1, 2, 3, 4, 5])
+        self.assertEqual(list(users[0]), ['username', 'role', 'id'])
+        self.assertEqual((users[0]['role'], users[1]['role']), ('Administrator', 'User'))
+        self.assertEqual(len(list(iter_users(['id'], page_size=5))), 5)
+        with self.assertRaises(ValueError):
+            parse_columns('id,password_hash')
+
+    def test_export_ndjson(self):
+        """ Test to validate that administrators get every user streamed as NDJSON """
+        self.login('admin@example.com', 'cat')
+        response = self.client.get('/admin/users/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+        users = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(users), 5)
+        self.assertEqual(users[1]['email'], 'user0@example.com')
+        self.assertNotIn('password_hash', users[1])
+
+    def test_export_csv(self):
+        """ Test to validate the CSV export of selected columns and the rejection of unknown ones """
+        self.login('admin@example.com', 'cat')
+        response = self.client.get('/admin/users/export?format=csv&columns=username,confirmed')
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows[0], ['username', 'confirmed'])
+        self.assertEqual(rows[1:], [['admin', 'True']] + [[f'user{i}', 'True'] for i in range(4)])
+        self.assertEqual(self.client.get('/admin/users/export?columns=password_hash').status_code, 400)
+        self.assertEqual(self.client.get('/admin/users/export?format=xml').status_code, 400)
+
+    def test_csv_formulas_quoted(self):
+        """ Test to validate that CSV cells a spreadsheet would run as formulas are exported as text """
+        user = User.query.filter_by(username='user0').first()
+        user.name = '=HYPERLINK("http://evil.example","x")'
+        user.location = '+1 555'
+        user.about_me = 'Plain - text'
+        db.session.commit()
+
+        self.login('admin@example.com', 'cat')
+        response = self.client.get('/admin/users/export?format=csv&columns=username,name,location,about_me')
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows[2], ['user0', '\'=HYPERLINK("http://evil.example","x")', "'+1 555", 'Plain - text'])
+
+        response = self.client.get('/admin/users/export?columns=name')
+        self.assertEqual(json.loads(response.get_data(as_text=True).splitlines()[1])['name'], user.name)
+
+    def test_admin_only(self):
+        """ Test to validate that only administrators can export users """
+        self.login('user0@example.com', 'dog')
+        self.assertEqual(self.client.get('/admin/users/export').status_code, 403)
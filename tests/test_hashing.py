@@ -0,0 +1,76 @@
+""" Password Hashing Service Tests """
+
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app, db, hashing, password_hasher
+from app.models import User, Role
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def configure(self, method, pool_size):
+        self.app.config['FLASKY_PASSWORD_HASH_METHOD'] = method
+        self.app.config['FLASKY_PASSWORD_HASH_POOL_SIZE'] = pool_size
+        password_hasher.init_app(self.app)
+
+    def test_pooled_hashing(self):
+        """ Test to validate that hashes made in the process pool verify like inline ones """
+        self.configure('pbkdf2:sha256:1000', 2)
+        u = User(password='cat')
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(u.verify_password('cat'))
+        self.assertFalse(u.verify_password('dog'))
+        # Never forked from a process running threads
+        self.assertNotEqual(hashing._executor(2)._mp_context.get_start_method(), 'fork')
+
+    def test_rehash_on_login(self):
+        """ Test to validate that logging in upgrades a hash made with an outdated method """
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(u)
+        db.session.commit()
+        self.assertFalse(u.password_needs_rehash())
+
+        self.configure('pbkdf2:sha256:2000', 0)
+        self.assertTrue(u.password_needs_rehash())
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        response = self.app.test_client().post('/auth/login', data={
+            'email': 'john@example.com', 'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+
+        db.session.expire_all()
+        u = User.query.filter_by(username='john').first()
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:2000$'))
+        self.assertTrue(u.verify_password('cat'))
+
+    def test_login_throughput_benchmark(self):
+        """ Benchmark reporting password verifications (logins) per second at several pool sizes """
+        method, logins, threads = 'pbkdf2:sha256:50000', 32, 4
+        self.configure(method, 0)
+        password_hash = password_hasher.hash('cat')
+        results = []
+
+        for pool_size in (0, 1, 2, 4):
+            self.configure(method, pool_size)
+            password_hasher.verify(password_hash, 'cat') # Starts the pool outside of the timing
+
+            def login(_):
+                with self.app.app_context():
+                    return password_hasher.verify(password_hash, 'cat')
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(threads) as executor:
+                self.assertTrue(all(executor.map(login, range(logins))))
+            results.append(f'{pool_size}: {logins / (time.perf_counter() - started):.0f}/s')
+
+        print('\nlogins/sec by hash pool size (0 = inline): ' + ', '.join(results))
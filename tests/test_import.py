@@ -0,0 +1,85 @@
+""" Bulk User Import Tests """
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, user_cache, password_hasher
+from app.importer import import_users, checkpoint_path, rejects_path, write_checkpoint
+from app.models import User, Role
+
+class ImportUsersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='john@example.com', username='john', password='cat'))
+        db.session.commit()
+
+    def tearDown(self):
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def rejects(self, path):
+        with open(rejects_path(path)) as f:
+            return [json.loads(line) for line in f]
+
+    def test_csv(self):
+        """ Test to validate that valid rows are imported and the others rejected with their reasons """
+        path = self.write('users.csv', 'email,username,password,location\n'
+                                       'Alice@Example.com,alice,secret,Lisbon\n'
+                                       'not-an-email,bob,secret,\n'
+                                       'JOHN@example.com,johnny,secret,\n'
+                                       'carol@example.com,carol,,\n'
+                                       'dave@example.com,dave,secret,\n'
+                                       'DAVE@example.com,dave2,secret,\n')
+        stats = import_users(path, batch_size=2)
+        self.assertEqual((stats['imported'], stats['rejected']), (2, 4))
+
+        alice = User.query.filter_by(username='alice').first()
+        self.assertEqual((alice.email, alice.location, alice.confirmed), ('alice@example.com', 'Lisbon', False))
+        self.assertTrue(alice.verify_password('secret'))
+        self.assertEqual(alice.role.name, 'User')
+        self.assertIsNone(User.query.filter_by(username='dave').first().location)
+
+        rejects = self.rejects(path)
+        self.assertEqual([reject['record'] for reject in rejects], [2, 3, 4, 6])
+        self.assertEqual(rejects[1]['errors'], {'email': ['Email already registered.']})
+        self.assertIn('password', rejects[2]['errors'])
+        self.assertTrue(all('password' not in reject['data'] for reject in rejects))
+        self.assertFalse(os.path.exists(checkpoint_path(path)))
+
+    def test_jsonl_resume(self):
+        """ Test to validate that an interrupted JSON Lines import resumes after its checkpoint """
+        path = self.write('users.jsonl', '\n'.join(json.dumps({'email': f'user{i}@example.com', 'username': f'user{i}',
+                                                                'password': 'dog'}) for i in range(5))
+                          + '\n{broken\n')
+        # Only records 1 and 2 went in before the interruption
+        import_users(path, batch_size=2)
+        User.query.filter(User.username.in_(['user2', 'user3', 'user4'])).delete()
+        db.session.commit()
+        write_checkpoint(path, {'record': 2, 'imported': 2, 'rejected': 0})
+
+        stats = import_users(path, batch_size=2, workers=1)
+        self.assertEqual((stats['skipped'], stats['imported'], stats['rejected']), (2, 3, 1))
+        self.assertEqual(User.query.filter(User.username.like('user%')).count(), 5)
+        self.assertEqual(self.rejects(path)[-1]['errors'], {'record': ['Invalid JSON']})
+
+    def test_hash_many(self):
+        """ Test to validate that passwords hashed in the process pool verify """
+        hashes = password_hasher.hash_many(['a', 'b', 'c'], workers=2)
+        self.assertEqual(len(hashes), 3)
+        self.assertTrue(all(password_hasher.verify(h, p) for h, p in zip(hashes, 'abc')))
@@ -0,0 +1,82 @@
+""" Metrics Endpoint Tests """
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from app import create_app, db, metrics, user_cache
+from app.models import User, Role
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='john@example.com', username='john', password='cat'))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def scrape(self) -> dict:
+        response = self.client.get('/metrics')
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.get_data(as_text=True).splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_request_metrics(self):
+        """ Test to validate request counters, latency histograms, gauges and pool stats """
+        for url in ('/user/john', '/user/john', '/no-such-page'):
+            self.client.get(url)
+        samples = self.scrape()
+
+        self.assertEqual(samples['flasky_requests_total{endpoint="main.user",method="GET",status="200"}'], 2)
+        self.assertEqual(samples['flasky_requests_total{endpoint="<unmatched>",method="GET",status="404"}'], 1)
+        self.assertEqual(samples['flasky_request_duration_seconds_count{endpoint="main.user",method="GET"}'], 2)
+        self.assertEqual(samples['flasky_request_duration_seconds_bucket{endpoint="main.user",method="GET",le="+Inf"}'], 2)
+        buckets = [value for name, value in samples.items()
+                   if name.startswith('flasky_request_duration_seconds_bucket{endpoint="main.user"')]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(samples['flasky_requests_in_flight'], 1) # The scrape itself
+        self.assertGreater(samples['flasky_db_pool_checkouts_total{bind="primary"}'], 0)
+        self.assertEqual(samples['flasky_mail_queue_depth'], 0)
+        self.assertEqual(samples['flasky_workers'], 1)
+
+    def test_workers_aggregated(self):
+        """ Test to validate that the scrape adds up the snapshots of all workers """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        state = metrics.state
+        state.directory = tmp_dir
+
+        self.client.get('/user/john')
+        # Another worker, still running, and one that exited
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                capture_output=True, text=True).stdout.strip()
+        for pid, requests in ((os.getppid(), 3), (int(exited), 4)):
+            snapshot = state.snapshot()
+            snapshot['pid'] = pid
+            snapshot['counters'] = [[name, labels, requests] for name, labels, _ in snapshot['counters']
+                                    if name == 'flasky_requests_total']
+            snapshot['gauges'] = [['flasky_requests_in_flight', [], 2]]
+            with open(os.path.join(tmp_dir, f'{pid}.json'), 'w') as f:
+                json.dump(snapshot, f)
+
+        samples = self.scrape()
+        self.assertEqual(samples['flasky_requests_total{endpoint="main.user",method="GET",status="200"}'], 1 + 3 + 4)
+        self.assertEqual(samples['flasky_requests_in_flight'], 1 + 2)
+        self.assertEqual(samples['flasky_workers'], 2)
+        self.assertTrue(os.path.exists(os.path.join(tmp_dir, f'{os.getpid()}.json')))
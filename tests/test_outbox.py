@@ -0,0 +1,124 @@
+""" Email Outbox Tests """
+
+import threading
+import unittest
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from app import create_app, db, mail, new_user_digest, outbox
+from app.email import send_email
+from app.models import OutboxEmail, Role, User
+from app.outbox import claim_batch, deliver, run_worker
+from test_email import SMTPStandIn
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_MAIL_OUTBOX'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def queue_email(self, email='john@example.com'):
+        u = User(email=email, username=email.split('@')[0], password='cat')
+        with self.app.test_request_context():
+            send_email(u.email, 'Confirm Your Account', 'auth/email/confirm', user=u, token='token')
+        return u
+
+    def test_email_is_part_of_the_transaction(self):
+        """ Test to validate that a queued email is only stored when the view's transaction commits """
+        self.queue_email()
+        db.session.rollback()
+        self.assertEqual(OutboxEmail.query.count(), 0)
+
+        self.queue_email()
+        db.session.commit()
+        self.assertEqual(OutboxEmail.query.filter_by(status='pending').count(), 1)
+
+    def test_worker_delivers_and_retries(self):
+        """ Test to validate that the worker sends due emails and backs off after a failure """
+        self.queue_email()
+        db.session.commit()
+
+        batch = claim_batch('worker-1', 10)
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(claim_batch('worker-2', 10), [])
+
+        self.app.extensions['mail'].suppress = False
+        self.app.extensions['mail'].server, self.app.extensions['mail'].port = '127.0.0.1', 1
+        self.assertEqual(deliver(batch), (0, 1))
+        email = OutboxEmail.query.one()
+        self.assertEqual(email.status, 'pending')
+        self.assertEqual(email.attempts, 1)
+        self.assertTrue(email.next_attempt_at > datetime.utcnow())
+
+        self.app.extensions['mail'].suppress = True
+        email.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        with mail.record_messages() as outbox:
+            run_worker(10, 0, once=True, log=lambda message: None)
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(OutboxEmail.query.one().status, 'sent')
+
+    def test_rejected_recipient_keeps_session(self):
+        """ Test to validate that a recipient refused by the server fails that email only, on the same connection """
+        server = SMTPStandIn()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        state = self.app.extensions['mail']
+        state.suppress, state.server, state.port = False, '127.0.0.1', server.server_address[1]
+        state.use_tls, state.username, state.password = False, None, None
+
+        for email in ('reject@example.com', 'john@example.com', 'susan@example.com'):
+            self.queue_email(email)
+        db.session.commit()
+
+        self.assertEqual(deliver(claim_batch('worker-1', 10)), (2, 1))
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(server.messages, 2)
+        rejected = OutboxEmail.query.filter_by(status='pending').one()
+        self.assertEqual(rejected.recipients, ['reject@example.com'])
+        self.assertEqual(rejected.attempts, 1)
+
+    def test_worker_survives_database_errors(self):
+        """ Test to validate that the worker logs a failed outbox query and carries on """
+        self.queue_email()
+        db.session.commit()
+
+        attempts = []
+        def locked_once(worker, size):
+            attempts.append(worker)
+            if len(attempts) == 1:
+                raise OperationalError('UPDATE outbox', {}, Exception('database is locked'))
+            return claim_batch(worker, size)
+        outbox.claim_batch = locked_once
+        self.addCleanup(setattr, outbox, 'claim_batch', claim_batch)
+
+        with self.assertLogs(self.app.logger, 'ERROR'), mail.record_messages() as sent:
+            run_worker(10, 0, once=True, log=lambda message: None)
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(OutboxEmail.query.one().status, 'sent')
+
+    def test_new_user_digest(self):
+        """ Test to validate that new user notifications within a window are sent as one email """
+        self.app.config['FLASKY_ADMIN'] = 'admin@example.com'
+        self.app.config['FLASKY_ADMIN_DIGEST_WINDOW'] = 60
+        new_user_digest.init_app(self.app)
+
+        for name in ('john', 'susan', 'david'):
+            new_user_digest.add(User(username=name))
+        self.assertEqual(OutboxEmail.query.count(), 0)
+
+        self.assertEqual(new_user_digest.flush(), 3)
+        email = OutboxEmail.query.one()
+        self.assertEqual(email.recipients, ['admin@example.com'])
+        self.assertIn('3 New Users', email.subject)
+        for name in ('john', 'susan', 'david'):
+            self.assertIn(name, email.body)
@@ -0,0 +1,68 @@
+""" Profile Page Cache Tests """
+
+import unittest
+from app import create_app, db, profile_cache
+from app.models import User, Role
+
+class ProfileCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(u)
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_conditional_get(self):
+        """ Test to validate that an unchanged profile is answered with 304 from the cache """
+        response = self.client.get('/user/john')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        hits = profile_cache.stats()['hits']
+        response = self.client.get('/user/john', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(profile_cache.stats()['hits'], hits + 1)
+        self.assertEqual(self.client.get('/user/nobody').status_code, 404)
+
+    def test_viewer_classes(self):
+        """ Test to validate that the owner gets their own cached profile with the edit button """
+        anonymous = self.client.get('/user/john')
+        self.assertNotIn('Edit Profile', anonymous.get_data(as_text=True))
+
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        own = self.client.get('/user/john', headers={'If-None-Match': anonymous.headers['ETag']})
+        self.assertEqual(own.status_code, 200)
+        self.assertIn('Edit Profile', own.get_data(as_text=True))
+
+    def test_edit_profile_invalidates(self):
+        """ Test to validate that editing a profile drops its cached pages """
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        etag = self.client.get('/user/john').headers['ETag']
+
+        self.client.post('/edit-profile', data={'name': 'John Doe', 'location': '', 'about_me': ''})
+        response = self.client.get('/user/john', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('John Doe', response.get_data(as_text=True))
+
+    def test_flashed_messages_not_cached(self):
+        """ Test to validate that a page showing a flashed message is sent without validators and not stored """
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        response = self.client.post('/edit-profile', data={'name': 'John Doe', 'location': '', 'about_me': ''},
+                                    follow_redirects=True)
+        self.assertIn('Your profile has been updated.', response.get_data(as_text=True))
+        self.assertNotIn('ETag', response.headers)
+        self.assertTrue(response.cache_control.no_store)
+
+        response = self.client.get('/user/john')
+        self.assertIn('ETag', response.headers)
+        self.assertNotIn('Your profile has been updated.', response.get_data(as_text=True))
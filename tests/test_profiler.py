@@ -0,0 +1,82 @@
+""" Request Profiler Tests """
+
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, user_cache
+from app.models import User, Role
+
+class RequestProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['FLASKY_PROFILE_DIR'] = self.tmp_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        admin_role = Role.query.filter_by(name='Administrator').first()
+        db.session.add_all([
+            User(email='admin@example.com', username='admin', password='cat', confirmed=True, role=admin_role),
+            User(email='john@example.com', username='john', password='dog', confirmed=True)])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp_dir)
+
+    def login(self, email, password):
+        self.client.post('/auth/login', data={'email': email, 'password': password})
+
+    def test_admin_only(self):
+        """ Test to validate that only administrators can arm the profiler """
+        self.login('john@example.com', 'dog')
+        self.assertEqual(self.client.get('/admin/profiles').status_code, 403)
+        self.assertEqual(self.client.post('/admin/profiles', data={'path': '/user/john', 'mode': 'cprofile'})
+                         .status_code, 403)
+
+    def test_no_open_redirect(self):
+        """ Test to validate that only paths on this site can be armed and redirected to """
+        self.login('admin@example.com', 'cat')
+        for path in ('//evil.example/x', '/\\evil.example/x'):
+            response = self.client.post('/admin/profiles', data={'path': path, 'mode': 'cprofile'})
+            self.assertIn(response.status_code, (200, 400), path)
+            self.assertIsNone(response.location)
+
+    def test_cprofile(self):
+        """ Test to validate that exactly the armed request is profiled and listed """
+        self.login('admin@example.com', 'cat')
+        response = self.client.post('/admin/profiles', data={'path': '/user/john', 'mode': 'cprofile'})
+        self.assertEqual(response.location, '/user/john')
+        self.client.get('/user/john')
+        self.client.get('/user/john')
+
+        files = sorted(os.listdir(self.tmp_dir))
+        self.assertEqual([os.path.splitext(file)[1] for file in files], ['.json', '.pstats', '.txt'])
+        stats = pstats.Stats(os.path.join(self.tmp_dir, files[1]))
+        self.assertTrue(any(name == 'user' for _, _, name in stats.stats))
+
+        listing = self.client.get('/admin/profiles').get_data(as_text=True)
+        self.assertIn('GET /user/john', listing)
+        self.assertEqual(self.client.get(f'/admin/profiles/{files[2]}').status_code, 200)
+
+    def test_sampling(self):
+        """ Test to validate that sampling profiles are written as collapsed stacks """
+        self.login('admin@example.com', 'cat')
+        self.client.post('/admin/profiles', data={'path': '/user/john?page=1', 'mode': 'sampling'})
+        self.client.get('/user/john?page=1')
+
+        collapsed = [file for file in os.listdir(self.tmp_dir) if file.endswith('.collapsed')]
+        self.assertEqual(len(collapsed), 1)
+        with open(os.path.join(self.tmp_dir, collapsed[0])) as f:
+            for line in f:
+                stack, count = line.rsplit(' ', 1)
+                self.assertGreater(int(count), 0)
+                self.assertIn(';', stack)
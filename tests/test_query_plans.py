@@ -0,0 +1,70 @@
+""" Query Plan Tests for the lookups behind authentication """
+
+import re
+import unittest
+from sqlalchemy import event
+from app import create_app, db, user_cache
+from app.models import User, Role
+
+class QueryPlanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='John@Example.com ', username='john', password='cat', confirmed=True))
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.capture)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.capture)
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def capture(self, conn, cursor, statement, parameters, context, executemany):
+        # Lookups only, the existence index rebuild reads the whole table on purpose
+        if statement.lstrip().upper().startswith('SELECT') and \
+                re.search(r'\bFROM users\b', statement) and 'WHERE' in statement:
+            self.statements.append((statement, parameters))
+
+    def assert_index_seeks(self):
+        """ Every captured SELECT on users must search an index, never scan the table """
+        self.assertTrue(self.statements)
+        connection = db.engine.raw_connection()
+        try:
+            for statement, parameters in self.statements:
+                plan = [row[3] for row in connection.cursor().execute(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()]
+                for step in plan:
+                    if re.search(r'\busers\b', step):
+                        self.assertTrue(step.startswith('SEARCH'), f'{statement}\n{plan}')
+        finally:
+            connection.close()
+
+    def test_emails_are_normalized(self):
+        """ Test to validate that emails are stored normalized and found in any case """
+        user = User.query.filter_by(username='john').first()
+        self.assertEqual(user.email, 'john@example.com')
+        self.assertEqual(User.find_by_email(' JOHN@example.COM'), user)
+        self.assertIsNone(User.find_by_email('susan@example.com'))
+
+    def test_auth_lookups_use_indexes(self):
+        """ Test to validate that the login, session, registration and change email lookups seek an index """
+        response = self.client.post('/auth/login', data={'email': 'JOHN@example.com', 'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        self.client.get('/')
+        self.client.get('/auth/check-availability?username=John&email=John@example.com')
+        self.client.post('/auth/change_email', data={'email': 'john@example.com', 'password': 'cat'})
+        self.client.get('/auth/logout')
+
+        response = self.client.post('/auth/register', data={
+            'email': 'john@EXAMPLE.com', 'username': 'john2', 'password': 'dog', 'password2': 'dog'})
+        self.assertIn(b'Email already registered.', response.data)
+
+        self.assert_index_seeks()
@@ -0,0 +1,78 @@
+""" Per-Request SQL Instrumentation Tests """
+
+import unittest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import create_app, db, existence_index, query_stats, user_cache
+from app.models import User, Role
+
+class QueryStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='john@example.com', username='john', password='cat', confirmed=True))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_server_timing(self):
+        """ Test to validate that responses report the request's query count and time """
+        response = self.client.get('/user/john')
+        timings = response.headers.getlist('Server-Timing')
+        self.assertTrue(timings[0].startswith('db;desc="'))
+        self.assertTrue(any(timing.startswith('app;dur=') for timing in timings))
+        self.assertNotIn('query-panel', response.get_data(as_text=True))
+
+    def test_query_budgets(self):
+        """ Test to validate the number of queries issued by the main pages of a logged in user """
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        existence_index.state.rebuild() # Once per worker, not part of any request's budget
+        for url, budget in (('/', 1), ('/user/john', 2), ('/edit-profile', 1)):
+            with query_stats.capture() as log:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertLessEqual(log.count, budget, f'{url}: {log.queries}')
+
+    def test_failed_statements(self):
+        """ Test to validate that statements that raise leave nothing behind on the pooled connection """
+        with db.engine.connect() as connection:
+            for _ in range(3):
+                with self.assertRaises(OperationalError):
+                    connection.execute(text('SELECT * FROM missing_table'))
+                connection.rollback()
+            self.assertEqual(connection.info.get('query_started', []), [])
+            with query_stats.capture() as log:
+                connection.execute(text('SELECT 1'))
+            self.assertEqual(log.count, 1)
+
+    def test_n_plus_one(self):
+        """ Test to validate that a statement repeated within one request is flagged """
+        @self.app.route('/n-plus-one')
+        def n_plus_one():
+            for username in ('john', 'susan', 'david'):
+                User.query.filter_by(username=username).first()
+            return ''
+
+        self.app.config['FLASKY_QUERY_N_PLUS_ONE'] = 3
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            response = self.client.get('/n-plus-one')
+        self.assertIn('n-plus-one;desc="1 repeated statements"', response.headers.getlist('Server-Timing'))
+        self.assertIn('executed 3 times', logs.output[0])
+
+    def test_debug_panel(self):
+        """ Test to validate that the debug panel lists the statements and disables caching """
+        self.app.config['FLASKY_QUERY_PANEL'] = True
+        response = self.client.get('/user/john')
+        body = response.get_data(as_text=True)
+        self.assertIn('<div id="query-panel"', body)
+        self.assertIn('FROM users', body)
+        self.assertIsNone(response.headers.get('ETag'))
+        self.assertTrue(response.cache_control.no_store)
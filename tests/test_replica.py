@@ -0,0 +1,67 @@
+""" Read Replica Routing Tests """
+
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, read_replica
+from app.models import User, Role
+from config import config, TestingConfig
+
+class ReadReplicaTestCase(unittest.TestCase):
+    # No app context stays pushed, so every request gets its own session like in production
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        config['replica'] = type('ReplicaConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmp_dir, 'primary.sqlite'),
+            'SQLALCHEMY_BINDS': {'replica': 'sqlite:///' + os.path.join(self.tmp_dir, 'replica.sqlite')},
+            'FLASKY_PROFILE_CACHE_BYTES': 0,
+            'FLASKY_USER_CACHE_SIZE': 0,
+            'WTF_CSRF_ENABLED': False,
+        })
+        self.app = create_app('replica')
+        with self.app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            db.session.add(User(email='john@example.com', username='john', password='cat',
+                                confirmed=True, about_me='original'))
+            db.session.commit()
+            read_replica.sync()
+
+    def tearDown(self):
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        # Flask-SQLAlchemy keeps an (empty) metadata for every bind key it was configured with
+        db.metadatas.pop('replica', None)
+        config.pop('replica')
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_only_views_use_replica(self):
+        """ Test to validate that read-only views read the replica and see writes once it is synced """
+        with self.app.app_context():
+            john = User.query.filter_by(username='john').first()
+            john.about_me = 'changed'
+            db.session.commit()
+
+        client = self.app.test_client()
+        self.assertIn(b'original', client.get('/user/john').data)
+        with self.app.app_context():
+            read_replica.sync()
+        self.assertIn(b'changed', client.get('/user/john').data)
+
+    def test_own_writes_read_from_primary(self):
+        """ Test to validate that a user who just wrote reads from the primary while others read the replica """
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        client.post('/edit-profile', data={'name': '', 'location': '', 'about_me': 'changed'})
+
+        self.assertIn(b'changed', client.get('/user/john').data)
+        self.assertIn(b'original', self.app.test_client().get('/user/john').data)
+
+        # Writes never reach the replica directly
+        with self.app.app_context():
+            with db.engines['replica'].connect() as connection:
+                about_me = connection.execute(db.select(User.about_me)).scalar()
+        self.assertEqual(about_me, 'original')
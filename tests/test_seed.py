@@ -0,0 +1,48 @@
+""" Synthetic User Generator Tests """
+
+import unittest
+from datetime import datetime
+from app import create_app, db, existence_index, user_cache
+from app.models import User, Role
+from app.seed import seed_users
+
+class SeedUsersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_seed_users(self):
+        """ Test to validate that generated users are complete, valid and sign in with the shared password """
+        stats = seed_users(250, password='cat', confirmed=0.5, batch_size=100, seed=1)
+        self.assertEqual(stats['rows'], 250)
+        self.assertGreater(stats['rows_per_second'], 0)
+
+        users = User.query.order_by(User.id).all()
+        self.assertEqual(len(users), 250)
+        self.assertEqual((users[0].username, users[-1].email), ('user0', 'user249@example.com'))
+        self.assertTrue(0 < sum(user.confirmed for user in users) < 250)
+        self.assertEqual(len({user.password_hash for user in users}), 1)
+        self.assertTrue(users[0].verify_password('cat'))
+        self.assertEqual(users[0].avatar_hash, users[0].gravatar_hash())
+        default_role = Role.query.filter_by(default=True).first()
+        self.assertGreater(sum(user.role_id == default_role.id for user in users), 200)
+        for user in users:
+            self.assertLessEqual(user.member_since, user.last_seen)
+            self.assertLessEqual(user.last_seen, datetime.utcnow())
+        self.assertTrue(existence_index.username_taken('user249'))
+
+    def test_repeated_runs(self):
+        """ Test to validate that further runs add users with new names """
+        seed_users(10, seed=1)
+        seed_users(10, seed=1)
+        self.assertEqual(User.query.count(), 20)
+        self.assertIsNotNone(User.query.filter_by(username='user19').first())
@@ -0,0 +1,68 @@
+""" Slow Query Log Tests """
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, slow_query_log, user_cache
+from app.models import User, Role
+from app.slowlog import read_entries, summarize
+
+class SlowQueryLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['FLASKY_SLOW_QUERY_LOG'] = os.path.join(self.tmp_dir, 'slow.jsonl')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='john@example.com', username='john', password='cat', confirmed=True))
+        db.session.commit()
+
+    def tearDown(self):
+        slow_query_log.close()
+        user_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_threshold(self):
+        """ Test to validate that statements below the threshold are not logged """
+        self.app.test_client().get('/user/john')
+        self.assertFalse(os.path.exists(self.app.config['FLASKY_SLOW_QUERY_LOG']))
+
+    def test_entries(self):
+        """ Test to validate that logged statements carry parameter types, call site and plan """
+        self.app.config['FLASKY_SLOW_QUERY_THRESHOLD'] = 0
+        self.app.test_client().post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+
+        with open(self.app.config['FLASKY_SLOW_QUERY_LOG']) as f:
+            entries = [json.loads(line) for line in f]
+        lookup = next(entry for entry in entries if 'WHERE users.email = ?' in entry['statement'])
+        self.assertEqual(lookup['endpoint'], 'auth.login')
+        self.assertEqual(lookup['parameters'], ['str', 'int', 'int'])
+        self.assertTrue(lookup['call_site'][0].startswith('app/models.py:'))
+        self.assertIn('find_by_email', lookup['call_site'][0])
+        self.assertTrue(lookup['plan'][0].startswith('SEARCH users USING INDEX ix_users_email'))
+
+    def test_report(self):
+        """ Test to validate that the report groups statements and flags full scans """
+        self.app.config['FLASKY_SLOW_QUERY_THRESHOLD'] = 0
+        client = self.app.test_client()
+        for _ in range(3):
+            client.get('/auth/check-availability?username=john')
+        User.query.filter(User.about_me.like('%cat%')).all()
+
+        summary = summarize(read_entries(self.app.config['FLASKY_SLOW_QUERY_LOG']))
+        by_statement = {group['statement']: group for group in summary}
+        lookup = next(group for statement, group in by_statement.items()
+                      if 'WHERE users.username = ?' in statement)
+        scan = next(group for statement, group in by_statement.items() if 'LIKE' in statement)
+
+        self.assertEqual(lookup['endpoints'], [('auth.check_availability', 3)])
+        self.assertEqual(lookup['scans'], [])
+        self.assertEqual(scan['scans'], ['SCAN users'])
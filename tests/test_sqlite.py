@@ -0,0 +1,110 @@
+""" SQLite Connection Profile Tests """
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from sqlalchemy import bindparam, text
+from app import create_app, db
+from app.models import User, Role
+from config import config, TestingConfig, ProductionConfig
+
+class SQLiteProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.apps = []
+
+    def tearDown(self):
+        for app in self.apps:
+            with app.app_context():
+                db.engine.dispose()
+        config.pop('sqlite-profile', None)
+        shutil.rmtree(self.tmp_dir)
+
+    def create_app(self, name, pragmas, engine_options=None):
+        """ Testing app on its own database file, with the given pragmas and pool options """
+        config['sqlite-profile'] = type('SQLiteProfileConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmp_dir, f'{name}.sqlite'),
+            'FLASKY_SQLITE_PRAGMAS': pragmas,
+            'SQLALCHEMY_ENGINE_OPTIONS': engine_options or {},
+        })
+        app = create_app('sqlite-profile')
+        self.apps.append(app)
+        with app.app_context():
+            db.create_all()
+            Role.insert_roles()
+        return app
+
+    def test_pragmas_applied(self):
+        """ Test to validate that every pooled connection gets the configured pragmas """
+        app = self.create_app('wal', ProductionConfig.FLASKY_SQLITE_PRAGMAS,
+                              ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS)
+        with app.app_context():
+            with db.engine.connect() as first, db.engine.connect() as second:
+                for connection in (first, second):
+                    self.assertEqual(connection.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+                    self.assertEqual(connection.execute(text('PRAGMA synchronous')).scalar(), 1) # NORMAL
+                    self.assertEqual(connection.execute(text('PRAGMA busy_timeout')).scalar(), 5000)
+                    self.assertEqual(connection.execute(text('PRAGMA cache_size')).scalar(), -64 * 1024)
+            self.assertEqual(db.engine.pool.size(), ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS['pool_size'])
+
+    def test_read_throughput_benchmark(self):
+        """ Benchmark reporting profile reads per second while last_seen writes run, by journal mode """
+        duration, readers, users = 1.0, 4, 1000
+        results = []
+
+        for name, pragmas in (('default', {}), ('production', ProductionConfig.FLASKY_SQLITE_PRAGMAS)):
+            app = self.create_app(name, pragmas, ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS)
+            with app.app_context():
+                db.session.execute(User.__table__.insert(), [
+                    {'email': f'user{i}@example.com', 'username': f'user{i}'} for i in range(users)])
+                db.session.commit()
+                engine = db.engine
+
+            users_table = User.__table__
+            read = users_table.select().where(users_table.c.username == bindparam('username'))
+            write = users_table.update().where(users_table.c.id == bindparam('user_id')) \
+                .values(last_seen=bindparam('seen'))
+            stop = threading.Event()
+            counts = {'reads': 0, 'writes': 0, 'errors': 0}
+            lock = threading.Lock()
+
+            def reader(offset):
+                i = offset
+                while not stop.is_set():
+                    try:
+                        with engine.connect() as connection:
+                            connection.execute(read, {'username': f'user{i % users}'}).first()
+                        key = 'reads'
+                    except Exception:
+                        key = 'errors'
+                    with lock:
+                        counts[key] += 1
+                    i += readers
+
+            def writer():
+                # The shape of a PingBuffer flush, committed back to back
+                while not stop.is_set():
+                    with engine.begin() as connection:
+                        connection.execute(write, [{'user_id': i, 'seen': datetime.utcnow()}
+                                                   for i in range(1, 51)])
+                    with lock:
+                        counts['writes'] += 1
+
+            threads = [threading.Thread(target=writer)] + \
+                [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+            for thread in threads:
+                thread.start()
+            time.sleep(duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+            self.assertGreater(counts['reads'], 0)
+            results.append(f"{name}: {counts['reads'] / duration:.0f} reads/s, "
+                           f"{counts['writes'] / duration:.0f} writes/s, {counts['errors']} errors")
+
+        print('\nreads with concurrent writes by SQLite profile: ' + '; '.join(results))
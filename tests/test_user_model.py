@@ -1,8 +1,14 @@
 """ Password Hashing Tests """
 
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from app import create_app, db
-from app.models import User, Permission, AnonymousUser, Role
+from app import create_app, db, ping_buffer, user_cache, identicon
+from app.models import User, Permission, AnonymousUser, Role, load_user
+from config import config, TestingConfig
 
 class UserModelTestCase(unittest.TestCase):
     """ Class to handle app.models.User test cases
@@ -67,4 +73,155 @@ class UserModelTestCase(unittest.TestCase):
         self.assertFalse(u.can(Permission.ADMIN))
         self.assertFalse(u.can(Permission.COMMENT))
         self.assertFalse(u.can(Permission.WRITE))
-        self.assertFalse(u.can(Permission.MODERATE))
\ No newline at end of file
+        self.assertFalse(u.can(Permission.MODERATE))
+
+    def test_ping_is_buffered(self):
+        """ Test to validate that ping() doesn't dirty the user and that the buffered timestamp is written
+        on flush, or by the timer when no request follows """
+        config['ping'] = type('PingConfig', (TestingConfig,), {'FLASKY_PING_FLUSH_INTERVAL': 30})
+        self.addCleanup(config.pop, 'ping')
+        app = create_app('ping')
+        with app.app_context():
+            db.create_all()
+            u = User(email='john@example.com', password='cat')
+            db.session.add(u)
+            db.session.commit()
+            before = u.last_seen
+            u.ping()
+            self.assertFalse(u in db.session.dirty)
+            self.assertTrue(u.last_seen > before)
+            self.assertEqual(ping_buffer.pending(), 1)
+            with self.app.app_context():
+                self.assertEqual(ping_buffer.pending(), 0) # Buffers are per app
+            self.assertEqual(ping_buffer.flush(), 1)
+            db.session.expire(u)
+            self.assertTrue(u.last_seen > before)
+
+            ping_buffer.state.flush_interval = 0.1
+            before = u.last_seen
+            u.ping()
+            time.sleep(0.5)
+            self.assertEqual(ping_buffer.pending(), 0)
+            db.session.expire(u)
+            self.assertTrue(u.last_seen > before)
+            db.session.remove()
+            db.drop_all()
+
+    def test_user_loader_cache(self):
+        """ Test to validate that the user_loader serves repeat loads from the cache until the user is invalidated """
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        user_id = u.id
+        db.session.remove()
+
+        before = user_cache.stats()
+        self.assertEqual(load_user(str(user_id)).email, 'john@example.com')
+        db.session.remove()
+        loaded = load_user(str(user_id))
+        self.assertTrue(loaded.can(Permission.WRITE))
+        self.assertEqual(user_cache.stats()['misses'], before['misses'] + 1)
+        self.assertEqual(user_cache.stats()['hits'], before['hits'] + 1)
+
+        loaded.name = 'John'
+        db.session.commit()
+        user_cache.invalidate(user_id)
+        db.session.remove()
+        self.assertEqual(load_user(str(user_id)).name, 'John')
+
+    def test_role_table_refreshed_after_role_edit(self):
+        """ Test to validate that permission checks see role edits once they are committed """
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertFalse(u.can(Permission.MODERATE))
+        r = Role.query.filter_by(name='User').first()
+        r.add_permission(Permission.MODERATE)
+        db.session.commit()
+        self.assertTrue(u.can(Permission.MODERATE))
+
+    def test_role_table_after_rollback(self):
+        """ Test to validate that role edits that are rolled back never reach permission checks """
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        r = Role.query.filter_by(name='User').first()
+        r.add_permission(Permission.MODERATE)
+        db.session.flush()
+        self.app.extensions.pop('role_table') # E.g. loaded for the first time mid-transaction
+        self.assertTrue(u.can(Permission.MODERATE))
+        db.session.rollback()
+        self.assertFalse(u.can(Permission.MODERATE))
+
+    def test_role_table_ttl(self):
+        """ Test to validate that role edits made by another worker show up after the TTL """
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertFalse(u.can(Permission.MODERATE))
+        db.session.execute(Role.__table__.update().where(Role.name == 'User')
+                           .values(permissions=Role.permissions + Permission.MODERATE))
+        db.session.commit()
+        self.assertFalse(u.can(Permission.MODERATE))
+        self.app.config['FLASKY_ROLE_TABLE_TTL'] = 0
+        self.assertTrue(u.can(Permission.MODERATE))
+
+    def test_gravatar(self):
+        """ Test to validate that gravatar URLs are built from the persisted avatar hash """
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        db.session.expire(u)
+        self.assertEqual(u.avatar_hash, 'd4c74594d841139328695756648b6bd6')
+        gravatar = u.gravatar()
+        gravatar_256 = u.gravatar(size=256)
+        gravatar_pg = u.gravatar(rating='pg')
+        gravatar_retro = u.gravatar(default='retro')
+        self.assertTrue('https://secure.gravatar.com/avatar/' +
+                        'd4c74594d841139328695756648b6bd6' in gravatar)
+        self.assertTrue('s=256' in gravatar_256)
+        self.assertTrue('r=pg' in gravatar_pg)
+        self.assertTrue('d=retro' in gravatar_retro)
+
+    def test_local_avatar(self):
+        """ Test to validate that local avatars are rendered once and served as immutable PNGs """
+        self.app.config['FLASKY_LOCAL_AVATARS'] = True
+        self.app.config['FLASKY_AVATAR_CACHE_DIR'] = tempfile.mkdtemp()
+        u = User(email='john@example.com', password='cat')
+        with self.app.test_request_context():
+            url = u.gravatar(size=64)
+        self.assertEqual(url, '/avatar/d4c74594d841139328695756648b6bd6/64')
+
+        client = self.app.test_client()
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertTrue(response.data.startswith(b'\x89PNG'))
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        response = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(client.get('/avatar/not-a-hash/64').status_code, 404)
+        shutil.rmtree(self.app.config['FLASKY_AVATAR_CACHE_DIR'])
+
+    def test_identicon_concurrent_renders(self):
+        """ Test to validate that threads rendering the same identicon never see a partial or missing file """
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        errors, paths = [], []
+
+        def render():
+            try:
+                paths.append(identicon.cached_path(cache_dir, 'd4c74594d841139328695756648b6bd6', 256))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=render) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(paths)), 1)
+        with open(paths[0], 'rb') as f:
+            self.assertEqual(f.read(), identicon.render('d4c74594d841139328695756648b6bd6', 256))
+        self.assertEqual(os.listdir(os.path.dirname(paths[0])), [os.path.basename(paths[0])])